@@ -1,9 +1,13 @@
 import importlib
 import sys
 
-def import_app(path, name):
+# source is the code of the app when it doesn't come from a file on disk, path is then only used in tracebacks
+def import_app(path, name, source = None):
     spec = importlib.util.spec_from_file_location(name, path)
     module = importlib.util.module_from_spec(spec)
     sys.modules[spec.name] = module
-    spec.loader.exec_module(module)
+    if source is None:
+        spec.loader.exec_module(module)
+    else:
+        exec(compile(source, path, 'exec'), module.__dict__)
     return module.MyApp
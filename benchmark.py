@@ -0,0 +1,268 @@
+from os import environ, path
+# must be set before pygame is imported
+environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+import sys, json, shutil, tempfile, subprocess, argparse, resource
+from time import perf_counter
+
+from virtualOS import *
+
+ROOT = path.dirname(path.abspath(__file__))
+BASELINE = path.join(ROOT, 'benchmark_baseline.json')
+
+SCENARIOS = {}
+
+def scenario(fun):
+    SCENARIOS[fun.__name__] = fun
+    return fun
+
+# runs a VirtualOS on a copy of the filesystem and times every frame. the copy is on disk like the real one,
+# or held in memory to leave out the disk
+class Bench:
+    def __init__(self, scale = 1.0, resolution = (1200, 900), workers = 0, memory = False):
+        self.scale = scale
+        self.dir = None
+        if memory:
+            fs = MemoryFS.from_disk(path.join(ROOT, 'filesystem'))
+        else:
+            self.dir = tempfile.mkdtemp(prefix='pygameOS-bench-')
+            shutil.copytree(path.join(ROOT, 'filesystem'), path.join(self.dir, 'filesystem'))
+            fs = path.join(self.dir, 'filesystem') + '/'
+        self.vos = VirtualOS(resolution, filesystem=fs)
+        self.vos.update_workers = workers
+        self.vos.boot()
+        self.times = []
+
+    def n(self, count):
+        return max(1, int(count * self.scale))
+
+    def frame(self, events = ()):
+        for event in events:
+            pg.event.post(event)
+        started = perf_counter()
+        self.vos.update()
+        self.vos.render()
+        self.times.append(perf_counter() - started)
+        self.vos.clock.tick()
+
+    def frames(self, count, events = ()):
+        self.frame(events)
+        for _ in range(count - 1):
+            self.frame()
+
+    def key(self, key):
+        return [pg.event.Event(pg.KEYDOWN, key=key, mod=0, unicode='', scancode=0),
+                pg.event.Event(pg.KEYUP, key=key, mod=0, unicode='', scancode=0)]
+
+    def mouse(self, pos, button = None):
+        pg.mouse.set_pos(pos)
+        if button is None:
+            return [pg.event.Event(pg.MOUSEMOTION, pos=pos, rel=(0, 0), buttons=(0, 0, 0))]
+        return [pg.event.Event(button, pos=pos, button=1)]
+
+    def wheel(self, y):
+        return [pg.event.Event(pg.MOUSEWHEEL, x=0, y=y, flipped=False, precise_x=0.0, precise_y=float(y))]
+
+    def run_app(self, name):
+        self.vos.run(name)
+        return self.vos.apps[-1]
+
+    def close(self):
+        self.vos.shutdown()
+        if self.dir:
+            shutil.rmtree(self.dir, ignore_errors=True)
+
+    def report(self):
+        times = sorted(self.times)
+        total = sum(times)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak *= 1024
+        return {
+            'frames': len(times),
+            'fps': len(times) / total if total else 0,
+            'p50_ms': times[len(times) // 2] * 1000,
+            'p99_ms': times[min(len(times) - 1, len(times) * 99 // 100)] * 1000,
+            'peak_mb': peak / 2**20,
+            }
+
+@scenario
+def windows(bench):
+    wins = []
+    for i in range(12):
+        win = TextApp(f"bench window {i}", bench.vos, (300 + i * 10, 200 + i * 5))
+        win.pos = (40 + i * 60, 80 + i * 40)
+        win.run()
+        win.update_render('\n'.join(f"window {i} line {line}" for line in range(8)))
+        wins.append(win)
+    for i in range(bench.n(600)):
+        if i % 10 == 0:
+            wins[i // 10 % len(wins)].focus()
+        bench.frame()
+
+@scenario
+def drag(bench):
+    for i in range(6):
+        win = TextApp(f"bench window {i}", bench.vos, (320, 240))
+        win.pos = (100 + i * 80, 100 + i * 60)
+        win.run()
+        win.update_render(f"window {i}")
+    x, y = win.tab_pos
+    x += 20
+    bench.frame(bench.mouse((x, y + 5), pg.MOUSEBUTTONDOWN))
+    for i in range(bench.n(600)):
+        dx, dy = (i * 7) % 600, (i * 3) % 400
+        bench.frame(bench.mouse((x + dx, y + 5 + dy)))
+    bench.frame(bench.mouse((x, y + 5), pg.MOUSEBUTTONUP))
+
+@scenario
+def editor_scroll(bench):
+    lines = bench.n(50000)
+    bench.vos.save('tmp/bench.txt', '\n'.join(f"{i:6} the quick brown fox jumps over the lazy dog" for i in range(lines)))
+    editor = bench.run_app('Text Editor')
+    editor.openfile('tmp/bench.txt')
+    editor.focus()
+    pg.mouse.set_pos(editor.pos)
+    steps = bench.n(300)
+    for i in range(steps):
+        bench.frame(bench.wheel(-3))
+    for i in range(steps):
+        bench.frame(bench.wheel(3))
+
+@scenario
+def files_tree(bench):
+    depth = bench.n(30)
+    folder = 'tmp/deep'
+    bench.vos.make_folder(folder)
+    names = []
+    for i in range(depth):
+        for j in range(5):
+            bench.vos.save(f"{folder}/file{j}.txt", str(j))
+        folder += f"/level{i}"
+        names.append(f"level{i}")
+        bench.vos.make_folder(folder)
+    files = bench.run_app('Files')
+
+    def choose(option):
+        branch = files.get_branch(files.location)
+        options = [opt for opt in branch if opt != 'flags']
+        if files.location:
+            options.insert(0, files.BACK)
+        files.idx = options.index(option)
+        bench.frame(bench.key(pg.K_RETURN))
+
+    for _ in range(bench.n(5)):
+        for name in ['tmp', 'open', 'deep', 'open'] + [step for name in names for step in (name, 'open')]:
+            choose(name)
+        while files.location:
+            choose(files.BACK)
+
+@scenario
+def pong(bench):
+    bench.run_app('Pong')
+    bench.frames(bench.n(10000))
+
+def run_scenario(name, scale, workers = 0, memory = False):
+    bench = Bench(scale, workers=workers, memory=memory)
+    try:
+        SCENARIOS[name](bench)
+        return bench.report()
+    finally:
+        bench.close()
+
+# plays an input recording (F5 in the OS) back on a fresh boot, at the recorded frame times
+def run_replay(path, scale, workers = 0, memory = False):
+    with open(path, 'rb') as f:
+        data = f.read()
+    res, _ = read_header(data)
+    bench = Bench(scale, res, workers, memory)
+    try:
+        # the recording can be anywhere on the host, the copied filesystem gets its own copy of it
+        bench.vos.fs.write(bench.vos.tmpdir + 'replay.rec', data, binary = True)
+        bench.vos.replay(bench.vos.tmpdir + 'replay.rec')
+        while bench.vos.input.player:
+            bench.frame()
+        return bench.report()
+    finally:
+        bench.close()
+
+def compare(results, baseline, tolerance):
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        for key in ('p50_ms', 'p99_ms', 'peak_mb'):
+            if result[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {base[key]:.2f} -> {result[key]:.2f}")
+        if result['fps'] < base['fps'] * (1 - tolerance):
+            regressions.append(f"{name}: fps {base['fps']:.1f} -> {result['fps']:.1f}")
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Headless pygameOS benchmarks")
+    parser.add_argument('scenarios', nargs='*', help=f"any of {', '.join(SCENARIOS)}, all by default")
+    parser.add_argument('--scale', type=float, default=1.0, help="multiplies frame counts and workload sizes")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the new baseline")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="allowed slowdown before a result counts as a regression")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="update thread safe apps on this many worker threads, results are stored under their own names")
+    parser.add_argument('--memory', action='store_true',
+                        help="run on an in-memory copy of the filesystem, results are stored under their own names")
+    parser.add_argument('--replay', action='append', default=[], metavar='RECORDING',
+                        help="also time the replay of an input recording, can be given more than once")
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--run-replay', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # every scenario runs in its own process so peak memory is measured per scenario
+    if args.run:
+        print(json.dumps(run_scenario(args.run, args.scale, args.workers, args.memory)))
+        return
+    if args.run_replay:
+        print(json.dumps(run_replay(args.run_replay, args.scale, args.workers, args.memory)))
+        return
+
+    runs = {}
+    for name in args.scenarios or ([] if args.replay else SCENARIOS):
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name}")
+        runs[name] = ['--run', name]
+    for recording in args.replay:
+        runs['replay ' + path.basename(recording)] = ['--run-replay', path.abspath(recording)]
+
+    results = {}
+    for name, run in runs.items():
+        if args.memory:
+            run = [*run, '--memory']
+            name += ' memory'
+        if args.workers:
+            name += f' workers{args.workers}'
+        out = subprocess.run([sys.executable, path.abspath(__file__), *run, '--scale', str(args.scale), '--workers', str(args.workers)],
+                             capture_output=True, text=True, cwd=ROOT)
+        if out.returncode:
+            print(out.stderr)
+            sys.exit(f"scenario {name} failed")
+        results[name] = json.loads(out.stdout.strip().splitlines()[-1])
+        r = results[name]
+        print(f"{name:22} {r['frames']:6} frames {r['fps']:8.1f} fps  p50 {r['p50_ms']:7.2f} ms  p99 {r['p99_ms']:7.2f} ms  peak {r['peak_mb']:7.1f} MB")
+
+    if args.save_baseline:
+        baseline = json.load(open(args.baseline)) if path.exists(args.baseline) else {}
+        baseline.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=1)
+        print(f"saved baseline to {args.baseline}")
+    elif path.exists(args.baseline):
+        regressions = compare(results, json.load(open(args.baseline)), args.tolerance)
+        for regression in regressions:
+            print("REGRESSION", regression)
+        if regressions:
+            sys.exit(1)
+        print("no regressions against", args.baseline)
+    else:
+        print("no baseline yet, store one with --save-baseline")
+
+if __name__ == '__main__':
+    main()
@@ -7,27 +7,25 @@ class MyApp(NodeApp):
         self.init_res = resolution
         self.setup_nodes()
         self.fs = False
-        self.vos.input.text = ""
         self.reset()
         self.update_exp()
 
     def fullscreen(self):
         self.fs = not self.fs
         self.resize(None if self.fs else self.init_res)
-        self.setup_nodes()
-        self.update_exp()
 
     def setup_nodes(self, expression_height = 35, font_size = 30, margin = 5):
 
         self.children = []
 
-        self.font = self.vos.default_font(font_size)
-        
-        W, H = self.res
-        EXP_H = expression_height
+        self.font = self.vos.fonts.get(size=font_size)
+
+        self.root = ColumnNode(self, fill=True)
+        self.add(self.root)
         
-        self.expression_node = TextNode(self, size=(W, EXP_H), text = "ANSWER HERE", font = self.font)
-        self.add(self.expression_node)
+        self.expression_node = TextNode(self, size=(self.res[0], expression_height), text = "ANSWER HERE", font = self.font)
+        self.expression_node.flex = 0
+        self.root.add(self.expression_node)
         
         button_data = {
             "(":lambda:self.type("("),
@@ -58,17 +56,12 @@ class MyApp(NodeApp):
             "FS":self.fullscreen,
             }
         self.btns_per_row = 4
-        BTN_W = W//self.btns_per_row
-        BTN_H = (H - EXP_H)/ceil(len(button_data)/self.btns_per_row)
+        self.buttons = GridNode(self, columns=self.btns_per_row, padding=margin//2, spacing=margin)
+        self.root.add(self.buttons)
 
-        x, y = 0, EXP_H
         for text, on_press in button_data.items():
-            btn = ButtonNode(self, size=(BTN_W-margin, BTN_H-margin), pos=(x+margin//2, y+margin//2), text=text, on_press=on_press, center=True, font = self.font)
-            self.add(btn)
-            x += BTN_W
-            if x >= W:
-                x = 0
-                y += BTN_H
+            btn = ButtonNode(self, text=text, on_press=on_press, center=True, font = self.font)
+            self.buttons.add(btn)
 
     def solve(self):
         try:
@@ -101,7 +94,7 @@ class MyApp(NodeApp):
 
     def update(self):
         super().update()
-        inp = self.vos.input
+        inp = self.input
         if inp.text:
             self.type(inp.text)
             inp.text = ""
@@ -1,4 +1,4 @@
-from virtualOS import DictMenuApp, pg, isdir, exists,PromptApp
+from virtualOS import DictMenuApp, pg, PromptApp
 
 class MyApp(DictMenuApp):
     def __init__(self, name, vos, resolution = (500, 400)):
@@ -7,7 +7,6 @@ class MyApp(DictMenuApp):
 
     def reset(self):
         self.copied = ""
-        self.root = self.vos.filesystem
         self.tree = self.make_options("")
 
     def save_file(self, path, callback):
@@ -27,26 +26,26 @@ class MyApp(DictMenuApp):
         if not self.copied:return
 
         self.vos.log('pasting '+self.copied+' to '+path)
-        
-        if isdir(self.root + self.copied):
-            self.vos.copy_folder(self.copied, path)
-        else:
-            self.vos.copy(self.copied, path)
 
-        self.on_paste(path)
-        self.update_tree()
+        def pasted(result):
+            self.on_paste(path)
+            self.update_tree()
+
+        if self.vos.isdir(self.copied):
+            self.vos.io.copy_folder(self.copied, path, pasted)
+        else:
+            self.vos.io.copy(self.copied, path, pasted)
 
     def delete(self, path):
-        self.vos.delete(path)
+        self.vos.io.delete(path, lambda result: self.update_tree())
         self.back()
-        self.tree = self.make_options("")
 
     def update_tree(self):
         self.tree = self.make_options("")
 
     def rename(self, from_path):
         to_path = '/'.join(from_path.split('/')[:-1])+'/'
-        callback = lambda name:(self.vos.rename(from_path, to_path+name), self.update_tree())
+        callback = lambda name:self.vos.io.rename(from_path, to_path+name, lambda result: self.update_tree())
         app = PromptApp("prompt", self.vos, f"Rename {from_path}:", callback)
         app.run()
         
@@ -55,9 +54,8 @@ class MyApp(DictMenuApp):
         self.tree = self.make_options(path)
 
     def open_file(self, path):
-        for app in self.vos.apps:
-            if app.open_path(path):
-                return
+        if self.vos.open_path(path):
+            return
         self.close()
     
     def make_options(self, path):
@@ -65,7 +63,7 @@ class MyApp(DictMenuApp):
             branch = {opt:self.make_options(path + opt) for opt in self.vos.list_folder(path)}
             branch["flags"] = ["double_back"]
             return branch
-        elif isdir(self.root + path):
+        elif self.vos.isdir(path):
             return {
                 "open":self.make_options(path+'/'),
                 "copy":lambda:self.copy(path),
@@ -86,7 +84,7 @@ class MyApp(DictMenuApp):
             branch = {opt:self.make_save_options(path + opt) for opt in self.vos.list_folder(path)}
             branch["flags"] = ["double_back"]
             return branch
-        elif isdir(self.root + path):
+        elif self.vos.isdir(path):
             return {
                 "open":self.make_save_options(path+'/'),
                 "save in folder":lambda:(self.paste(path),self.close())
@@ -95,5 +93,9 @@ class MyApp(DictMenuApp):
     def update(self):
         super().update()
         self.text = '/'.join([self.location[i] for i in range(len(self.location)) if 1 - i % 2])
+        # progress of the copies and deletes still going on
+        status = self.vos.io.status()
+        if status:
+            self.text += '\n' + status
 
     
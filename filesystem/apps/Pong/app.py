@@ -22,9 +22,9 @@ class Paddle(RectNode):
         self.speed = 5
     def update(self):
         super().update()
-        if self.inps[0] in self.vos.input.keys: # up
+        if self.inps[0] in self.app.input.keys: # up
             self.y -= self.speed
-        if self.inps[1] in self.vos.input.keys: # down
+        if self.inps[1] in self.app.input.keys: # down
             self.y += self.speed
         self.y = max(0,min(self.y, self.app.res[1]-self.size[1]))
 
@@ -32,6 +32,8 @@ class MyApp(NodeApp):
     def __init__(self, name, vos, resolution=(400, 400)):
         super().__init__(name, vos, resolution)
         self.init_res = resolution
+        self.animating = True
+        self.thread_safe = True
         self.setup_nodes()
 
     def setup_nodes(self):
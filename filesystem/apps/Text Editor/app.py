@@ -31,8 +31,9 @@ class MyApp(NodeApp):
         self.interval = 100
         self.first_interval_mul = 2
         self.blink = 1000
-
-        self.cursor = "\u2588"
+        self.blink_timer = None
+        self.cursor_visible = True
+        self.repeat_timer = None
 
         self.savepath = None
         self.saved = True
@@ -40,11 +41,10 @@ class MyApp(NodeApp):
     def toggle_fs(self):
         self.fullscreen = not self.fullscreen
         self.resize(self.vos.res if self.fullscreen else self.ores)
-        self.setup_nodes()
 
     def open_path(self, path):
         if self.can_open_path(path):
-            self.openfile(path)
+            self.spawn(self.openfile_async(path))
             self.focus()
             return True
         return False
@@ -52,33 +52,42 @@ class MyApp(NodeApp):
     def btnsaveas(self):
         def cb(name):
             print("SAVING", name)
-            self.vos.save("tmp/"+name, self.get_text())
+            self.vos.io.save("tmp/"+name, self.lines.iter_text())
             self.vos.run("Files")
             filesapp = self.vos.get_app("Files")
-            
+            if not filesapp:
+                # Files runs in another process when the editor is isolated
+                self.vos.log(f"Saved to tmp/{name}, move it with Files\n")
+                return
+
             def cb2(savepath):
                 print("SUCCESSFULLY SAVED", name, "TO", savepath)
                 self.saved = True
                 self.savepath = savepath
-                self.vos.delete("tmp/"+name)
+                self.vos.io.delete("tmp/"+name)
                 filesapp.close()
                 
             filesapp.save_file(name, cb2)
         PromptApp("prompt", self.vos, "Enter file name below (including type).", cb).run()
 
-    def btnsave(self):
-        if self.savepath: self.vos.save(self.savepath, self.get_text())
+    # the text is copied, so it can be edited while the file is being written
+    async def btnsave(self):
+        if self.savepath: await self.vos.save_async(self.savepath, self.lines.text)
 
     def btnnewfile(self):
         self.savepath = None
-        self.lines = ['']
+        self.lines = TextBuffer()
         self.reset_cursor()
 
-    def openfile(self, path):
+    def openfile(self, path, text = None):
         self.savepath = path
-        self.lines = self.vos.load(path).split('\n')
+        self.lines = TextBuffer.from_text(self.vos.load(path) if text is None else text)
         self.reset_cursor()
 
+    # big files are read on a worker thread while the OS keeps drawing
+    async def openfile_async(self, path):
+        self.openfile(path, await self.vos.load_async(path))
+
     def reset_cursor(self):
         self.old_text = ""
         self.scroll = 0
@@ -86,7 +95,7 @@ class MyApp(NodeApp):
         self.at_y = 0
 
     def get_text(self):
-        return '\n'.join(self.lines)
+        return self.lines.text
 
     def setup_nodes(self, tabh = None, line_height = None):
         self.line_height = line_height
@@ -95,14 +104,20 @@ class MyApp(NodeApp):
 
         self.children = []
 
-        self.tab = RectNode(self, (0,0), (self.res[0], self.tabh), color = self.tabc)
-        self.add(self.tab)
+        self.root = ColumnNode(self, fill = True)
+        self.add(self.root)
+
+        self.tab = RowNode(self, size = (self.res[0], self.tabh), color = self.tabc)
+        self.tab.flex = 0
+        self.root.add(self.tab)
         
-        self.text = ScrollTextNode(self, (0, self.tabh), (self.res[0], self.res[1] - self.tabh),
-                                   font = self.font, color = self.color, background = self.bg,
+        self.text = ScrollTextNode(self, font = self.font, color = self.color, background = self.bg,
                                    line_height = self.line_height, draw_srf = None)
         self.line_height = self.text.line_height
-        self.add(self.text)
+        self.root.add(self.text)
+
+        self.caret = CaretNode(self, self.text, self.color)
+        self.text.add(self.caret)
 
         self.buttons = {}
 
@@ -113,45 +128,44 @@ class MyApp(NodeApp):
             "fullscreen": self.toggle_fs
             }
 
-        x = 0
-        w = self.tab.size[0] // len(btndata)
-
         for text, fun in btndata.items():
-            btn = ButtonNode(self, (x, 0), (w, self.tabh), text, self.font,
-                                    on_press=fun, center = True)
+            btn = ButtonNode(self, text = text, font = self.font, on_press = fun, center = True)
             self.buttons[text] = btn
             self.tab.add(btn)
-            x += w
 
-        self.changed_at = 0
+    def toggle_blink(self):
+        # stop waking up for an editor that isn't focused, update() restarts the timer
+        if not self.can_update:
+            self.blink_timer.cancel()
+            self.blink_timer = None
+            self.cursor_visible = True
+            return
+        self.cursor_visible = not self.cursor_visible
+
+    def start_repeat(self, key, dx):
+        if self.repeat_timer:
+            self.repeat_timer.cancel()
+        self.repeat_timer = self.schedule(self.interval * self.first_interval_mul,
+                                          lambda: self.repeat_key(key, dx), self.interval)
+
+    def repeat_key(self, key, dx):
+        if key not in self.input.keys:
+            self.repeat_timer.cancel()
+            return
+        self.at_x += dx
 
     def handle_cursor(self):
-        inp = self.vos.input
+        inp = self.input
         if pg.K_LEFT in inp.keys_inst:
             self.at_x -= 1
-            self.changed_at = self.vos.time + self.interval * self.first_interval_mul
+            self.start_repeat(pg.K_LEFT, -1)
         elif pg.K_RIGHT in inp.keys_inst:
             self.at_x += 1
-            self.changed_at = self.vos.time + self.interval * self.first_interval_mul
+            self.start_repeat(pg.K_RIGHT, 1)
         elif pg.K_DOWN in inp.keys_inst:
             self.at_y += 1
-            self.changed_at = self.vos.time + self.interval * self.first_interval_mul
         elif pg.K_UP in inp.keys_inst:
             self.at_y -= 1
-            self.changed_at = self.vos.time + self.interval * self.first_interval_mul
-        else:
-            at_x, at_y = self.at_x, self.at_y
-                
-            changed = True
-            if pg.K_LEFT in inp.keys:
-                at_x -= 1
-            elif pg.K_RIGHT in inp.keys:
-                at_x += 1
-            else:
-                changed = False
-            if changed and self.vos.time - self.changed_at > self.interval:
-                self.at_x = at_x
-                self.changed_at = self.vos.time
 
         self.at_y = min(max(0, self.at_y), len(self.lines)-1)
         if pg.K_LEFT in inp.keys or pg.K_RIGHT in inp.keys:
@@ -165,12 +179,12 @@ class MyApp(NodeApp):
         self.at_x = min(max(0, self.at_x), len(self.lines[self.at_y]))
 
     def update_typing(self):
-        inp = self.vos.input
+        inp = self.input
         
         if inp.text:
             line = self.lines[self.at_y]
             self.lines[self.at_y] = line[:self.at_x] + inp.text + line[self.at_x:]
-            inp.keys_inst.append(pg.K_RIGHT)
+            self.at_x += len(inp.text)
             self.saved = False
         inp.text = ""
 
@@ -179,33 +193,27 @@ class MyApp(NodeApp):
                 self.lines[self.at_y][:self.at_x]
             self.lines.insert(self.at_y+1, line)
             self.lines[self.at_y] = remains
-            inp.keys_inst.append(pg.K_RIGHT)
-            inp.keys.append(pg.K_RIGHT)
+            self.at_y += 1
+            self.at_x = 0
             self.saved = False
             
         if pg.K_BACKSPACE in inp.keys_inst:
             if self.at_x == 0:
-                lines = self.lines
-                self.at_x = len(lines[self.at_y-1])
-                self.lines[self.at_y-1] += lines[self.at_y]
-                self.lines = lines[:self.at_y] + lines[self.at_y+1:]
+                if self.at_y:
+                    self.at_x = len(self.lines[self.at_y-1])
+                    self.lines[self.at_y-1] += self.lines[self.at_y]
+                    del self.lines[self.at_y]
+                    self.at_y -= 1
             else:
                 line = self.lines[self.at_y]
-                if line:
-                    self.lines[self.at_y] = line[:self.at_x-1] + line[self.at_x:]
-            inp.keys_inst.append(pg.K_LEFT)
-            inp.keys.append(pg.K_LEFT)
+                self.lines[self.at_y] = line[:self.at_x-1] + line[self.at_x:]
+                self.at_x -= 1
             self.saved = False
 
         self.handle_cursor()
 
-        if pg.K_RETURN in inp.keys_inst:
-            inp.keys.remove(pg.K_RIGHT)
-        if pg.K_BACKSPACE in inp.keys_inst:
-            inp.keys.remove(pg.K_LEFT)
-
     def update_click(self):
-        inp = self.vos.input
+        inp = self.input
         if inp.click_inst and point_within_rect(inp.mouse, self.rect):
             mx, my = self.mouse
             my -= self.tabh
@@ -220,16 +228,12 @@ class MyApp(NodeApp):
 
         self.update_click()
 
+        if not self.blink_timer:
+            self.blink_timer = self.every(self.blink//2, self.toggle_blink)
+
     def render(self):
         self.buttons['save'].text = "save" if self.saved else "save*"
-        self.srf.fill(self.bg)
-        if self.vos.time % self.blink < self.blink//2:
-            text = [str(s) for s in self.lines]
-            line = text[self.at_y]
-            try:line = line[:self.at_x] + self.cursor + line[self.at_x + 1:]
-            except IndexError:pass
-            text[self.at_y] = line
-            self.text.text = '\n'.join(text)
-        else:
-            self.text.text = self.get_text()
+        self.text.lines = self.lines
+        self.caret.row, self.caret.col = self.at_y, self.at_x
+        self.caret.visible = self.cursor_visible
         super().render()
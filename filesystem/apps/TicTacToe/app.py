@@ -17,19 +17,16 @@ class MyApp(WindowApp):
         self.bg = (10,10,10)
         self.fg = (100,100,100)
         self.grid = [[0,0,0],[0,0,0],[0,0,0]]
-        self.X_IMG = self.load_image("X.png")
-        self.O_IMG = self.load_image("O.png")
         self.margin = 20
         self.gridsz = self.margin//5
         self.SZ = 32#(32 - self.margin * 4)//3
         self.turn = 1
-        def resize(img):
-            return pg.transform.smoothscale(img, (self.SZ, self.SZ))
-        self.X_IMG = resize(self.X_IMG)
-        self.O_IMG = resize(self.O_IMG)
+        self.X_IMG = self.load_image("X.png", size=(self.SZ, self.SZ), smooth=True)
+        self.O_IMG = self.load_image("O.png", size=(self.SZ, self.SZ), smooth=True)
         self.winner = None
-        self.font = pg.font.SysFont('helvetica', 40)
+        self.font = self.vos.fonts.get('helvetica', 40)
         self.stop_rendering = False
+        self.reports_damage = True
     def render(self):
         super().render()
         if self.stop_rendering:
@@ -70,7 +67,7 @@ class MyApp(WindowApp):
         super().update()
         if self.winner:
             return
-        inp = self.vos.input
+        inp = self.input
         mx, my = inp.mouse
         mx -= self.pos[0] + self.margin//2
         mx //= self.SZ + self.margin
@@ -80,3 +77,4 @@ class MyApp(WindowApp):
             self.grid[my][mx] = self.turn
             self.turn *= -1
             self.check_win()
+            self.damage()
@@ -1,4 +1,4 @@
-from virtualOS import SurfaceApp, pg, point_within_rect
+from virtualOS import SurfaceApp, pg
 
 APP_ORDER = ["Power Off", "Files"]
 
@@ -15,76 +15,103 @@ class MyApp(SurfaceApp):
         self.app_size = 64
         self.margin = self.app_size // 10
         self.bg = (25, 25, 25)
-        self.app_font = pg.font.SysFont("monospace", self.app_size//2, True)
+        self.app_font = self.vos.fonts.get("monospace", self.app_size//2, bold=True)
         self.minimized_app_names = []
         self.minimized_apps = []
+        self.reports_damage = True
+        # the icon grid is only redrawn when the minimized apps change
+        self.dirty = True
         
     def default_icon(self, app):
-        srf = pg.Surface((self.app_size, self.app_size))
+        srf = self.vos.surfaces.get((self.app_size, self.app_size), owner=self)
         srf.blit(self.app_font.render(app.title()[:2], True, (255, 255, 255), (0,0,0)), (0,0))
         return srf
     
     def get_icon(self, app):
-        img = self.vos.load_image(self.vos.appdir + app + '/' + 'icon.png', transparent=True)
+        img = self.vos.load_image(self.vos.appdir + app + '/' + 'icon.png', transparent=True,
+                                  size=(self.app_size, self.app_size))
         if img:
-            img = pg.transform.scale(img, (self.app_size, self.app_size))
             return img
         else:
             return self.default_icon(app)
         
     def on_run(self):
         self.icons = {app: self.get_icon(app) for app in self.apps}
-        self.minimized_overlay = pg.Surface((self.app_size, self.app_size), pg.SRCALPHA)
+        self.minimized_overlay = self.vos.surfaces.get((self.app_size, self.app_size), alpha=True, owner=self)
         self.minimized_overlay.fill((200, 200, 200, 127))
+        self.names = list(self.icons)
+        self.cols = max(1, self.res[0] // (self.app_size + self.margin))
+        for app in self.vos.apps:
+            self.hook_app(app)
+        self.vos.on_run.append(self.hook_app)
+        self.redraw()
+
+    def on_close(self):
+        if self.hook_app in self.vos.on_run:
+            self.vos.on_run.remove(self.hook_app)
+
+    def hook_app(self, app):
+        if "WindowApp" in app.flags:
+            app.on_minimize = self.on_minimize
+
+    def redraw(self):
+        self.dirty = True
+        self.damage()
         
     def on_minimize(self, app):
         self.minimized_apps.append(app)
         self.minimized_app_names.append(app.name)
+        self.redraw()
 
-    @property
-    def mouse_not_within_app(self):
-        for app in self.vos.apps:
-            if 'WindowApp' in app.flags and point_within_rect(self.vos.input.mouse, app.full_rect):
-                return False
-        return True
+    def icon_pos(self, i):
+        row, col = divmod(i, self.cols)
+        step = self.app_size + self.margin
+        return self.margin + col * step, self.margin + row * step
+
+    # the icon under point, found from the grid cell instead of checking every icon
+    def icon_at(self, point):
+        step = self.app_size + self.margin
+        x, y = point[0] - self.margin, point[1] - self.margin
+        if x < 0 or y < 0:
+            return None
+        col, cx = divmod(x, step)
+        row, cy = divmod(y, step)
+        # the gap between icons
+        if cx >= self.app_size or cy >= self.app_size or col >= self.cols:
+            return None
+        i = row * self.cols + col
+        return self.names[i] if i < len(self.names) else None
 
     def update(self):
         super().update()
-        for app in self.vos.apps:
-            if "WindowApp" in app.flags:
-                app.on_minimize = self.on_minimize
-        x, y = self.margin, self.margin
-        for app_name, icon in self.icons.items():
-            if self.vos.input.click_inst and self.mouse_not_within_app:
-                if point_within_rect(self.vos.input.mouse, (x, y, self.app_size, self.app_size)):
-                    if app_name in self.minimized_app_names:
-                        app = self.minimized_apps[self.minimized_app_names.index(app_name)]
-                        app.visible = True
-                        self.minimized_app_names.remove(app_name)
-                        self.minimized_apps.remove(app)
-                    else:
-                        result = self.vos.run(app_name)
-                        if result == 2:
-                            self.vos.get_app(app_name).minimize()
-            
-            x += self.app_size + self.margin
-            if x + self.app_size > self.res[0]:
-                x = self.margin
-                y += self.app_size + self.margin
+        # only clicks outside of every window get here
+        if not self.input.click_inst:
+            return
+        app_name = self.icon_at(self.input.mouse)
+        if app_name is None:
+            return
+        if app_name in self.minimized_app_names:
+            app = self.minimized_apps[self.minimized_app_names.index(app_name)]
+            app.visible = True
+            self.minimized_app_names.remove(app_name)
+            self.minimized_apps.remove(app)
+            self.redraw()
+        else:
+            result = self.vos.run(app_name)
+            if result == 2:
+                self.vos.get_app(app_name).minimize()
         
     def render(self):
         if not self.visible:
             return
-        
-        self.srf.fill(self.bg)
-        x, y = self.margin, self.margin
-        for app_name, icon in self.icons.items():
-            self.srf.blit(icon, (x, y))
-            if app_name in self.minimized_app_names:
-                self.srf.blit(self.minimized_overlay, (x,y))
-            x += self.app_size + self.margin
-            if x + self.app_size > self.res[0]:
-                x = self.margin
-                y += self.app_size + self.margin
+
+        if self.dirty:
+            self.dirty = False
+            self.srf.fill(self.bg)
+            for i, (app_name, icon) in enumerate(self.icons.items()):
+                x, y = self.icon_pos(i)
+                self.srf.blit(icon, (x, y))
+                if app_name in self.minimized_app_names:
+                    self.srf.blit(self.minimized_overlay, (x,y))
                 
         super().render()
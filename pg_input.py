@@ -1,19 +1,163 @@
 from os import environ
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "TRUE"
+import struct
+from math import ceil
 import pygame as pg
 
 
+# the events apps receive, made from the pygame events in Input.update
+class KeyDown:
+    def __init__(self, key, mod = 0, unicode = ''):
+        self.key, self.mod, self.unicode = key, mod, unicode
+
+class KeyUp:
+    def __init__(self, key, mod = 0):
+        self.key, self.mod = key, mod
+
+class TextInput:
+    def __init__(self, text):
+        self.text = text
+
+class MouseDown:
+    def __init__(self, pos, button = 1):
+        self.pos, self.button = pos, button
+
+class MouseUp:
+    def __init__(self, pos, button = 1):
+        self.pos, self.button = pos, button
+
+class MouseWheel:
+    def __init__(self, x, y):
+        self.x, self.y = x, y
+
+# only made for apps that asked for raw motion, the others read the latest position from Input.mouse
+class MouseMotion:
+    def __init__(self, pos, rel, buttons):
+        self.pos, self.rel, self.buttons = pos, rel, buttons
+
+KEYBOARD_EVENTS = (KeyDown, KeyUp, TextInput)
+
+# posted by the file queue's worker so the idle loop wakes up to run the callbacks
+FILE_IO = pg.event.custom_type()
+
+
+# recordings hold every frame's time step, pointer position and pygame events, so a session can be played back
+# without SDL. a header with the screen size and the random seed, then per frame: dt in ms, mouse x and y,
+# the number of events, and for each event its type index in RECORDED followed by its fields
+RECORDED = [pg.QUIT, pg.KEYDOWN, pg.KEYUP, pg.TEXTINPUT, pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP,
+            pg.MOUSEWHEEL, pg.MOUSEMOTION, pg.WINDOWEXPOSED, pg.VIDEOEXPOSE]
+REC_MAGIC = b'PGOSREC1'
+REC_HEADER = struct.Struct('<8sHHI')
+REC_FRAME = struct.Struct('<IhhH')
+REC_TYPE = struct.Struct('<B')
+REC_KEY = struct.Struct('<iH')
+REC_TEXT = struct.Struct('<H')
+REC_BUTTON = struct.Struct('<hhB')
+REC_WHEEL = struct.Struct('<hh')
+REC_MOTION = struct.Struct('<hhhhB')
+
+# data is the recording's bytes, or at least its first REC_HEADER.size of them
+def read_header(data):
+    if len(data) < REC_HEADER.size:
+        raise ValueError("not an input recording")
+    magic, w, h, seed = REC_HEADER.unpack_from(data)
+    if magic != REC_MAGIC:
+        raise ValueError("not an input recording")
+    return (w, h), seed
+
+# the frames are kept in memory, whoever stops the recording writes data() to path
+class Recorder:
+    def __init__(self, path, res = (0, 0), seed = 0):
+        self.path = path
+        self.chunks = [REC_HEADER.pack(REC_MAGIC, *res, seed)]
+        self.frames = 0
+
+    def frame(self, dt, mouse, events):
+        events = [event for event in events if event.type in RECORDED]
+        out = [REC_FRAME.pack(int(dt), *mouse, len(events))]
+        for event in events:
+            out.append(REC_TYPE.pack(RECORDED.index(event.type)))
+            if event.type in (pg.KEYDOWN, pg.KEYUP):
+                out.append(REC_KEY.pack(event.key, event.mod))
+                if event.type == pg.KEYDOWN:
+                    out.append(self.text(event.unicode))
+            elif event.type == pg.TEXTINPUT:
+                out.append(self.text(event.text))
+            elif event.type in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+                out.append(REC_BUTTON.pack(*event.pos, event.button))
+            elif event.type == pg.MOUSEWHEEL:
+                out.append(REC_WHEEL.pack(event.x, event.y))
+            elif event.type == pg.MOUSEMOTION:
+                buttons = sum(1 << i for i, pressed in enumerate(event.buttons) if pressed)
+                out.append(REC_MOTION.pack(*event.pos, *event.rel, buttons))
+        self.chunks.append(b''.join(out))
+        self.frames += 1
+
+    def text(self, text):
+        data = text.encode()
+        return REC_TEXT.pack(len(data)) + data
+
+    def data(self):
+        return b''.join(self.chunks)
+
+class Replay:
+    def __init__(self, data):
+        self.data = data
+        self.res, self.seed = read_header(data)
+        self.at = REC_HEADER.size
+
+    def read(self, fmt):
+        values = fmt.unpack_from(self.data, self.at)
+        self.at += fmt.size
+        return values
+
+    def text(self):
+        size, = self.read(REC_TEXT)
+        self.at += size
+        return self.data[self.at - size:self.at].decode()
+
+    # (dt, mouse, pygame events) of the next frame, None once the recording is over
+    def next_frame(self):
+        if self.at >= len(self.data):
+            return None
+        dt, x, y, count = self.read(REC_FRAME)
+        events = []
+        for _ in range(count):
+            kind = RECORDED[self.read(REC_TYPE)[0]]
+            if kind in (pg.KEYDOWN, pg.KEYUP):
+                key, mod = self.read(REC_KEY)
+                attrs = {'key': key, 'mod': mod, 'scancode': 0}
+                if kind == pg.KEYDOWN:
+                    attrs['unicode'] = self.text()
+            elif kind == pg.TEXTINPUT:
+                attrs = {'text': self.text()}
+            elif kind in (pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP):
+                bx, by, button = self.read(REC_BUTTON)
+                attrs = {'pos': (bx, by), 'button': button}
+            elif kind == pg.MOUSEWHEEL:
+                wx, wy = self.read(REC_WHEEL)
+                attrs = {'x': wx, 'y': wy, 'flipped': False}
+            elif kind == pg.MOUSEMOTION:
+                mx, my, rx, ry, buttons = self.read(REC_MOTION)
+                attrs = {'pos': (mx, my), 'rel': (rx, ry), 'buttons': tuple(bool(buttons >> i & 1) for i in range(3))}
+            else:
+                attrs = {}
+            events.append(pg.event.Event(kind, attrs))
+        return dt, (x, y), events
+
+
 class Input:
+    # every other event type is dropped by SDL before it reaches Python
+    EVENTS = [pg.QUIT, pg.KEYDOWN, pg.KEYUP, pg.TEXTINPUT, pg.MOUSEBUTTONDOWN, pg.MOUSEBUTTONUP,
+              pg.MOUSEWHEEL, pg.WINDOWEXPOSED, pg.VIDEOEXPOSE, FILE_IO]
+
     def __init__(self):
         # keys_inst is reset with every update
-        # if key in keys[]
-        self.keys_inst = []
-        self.keys = []
-        
-        self.quit = False
+        # if key in keys
+        self.keys_inst = set()
+        self.keys = set()
 
-        # to keep track of input text, you can simply set it to "" and then it will automatically update.
-        self.text = ""
+        self.quit = False
 
         self.mouse = (0,0)
         self.click_inst = False
@@ -22,39 +166,179 @@ class Input:
         self.on_click = []
 
         self.scroll = 0
-        
-    def update(self):
+
+        # this frame's events, handed to the apps by VirtualOS
+        self.events = []
+
+        # events taken off the queue while waiting, handled with the next update
+        self.waited = []
+
+        # set when the window has to be drawn again, e.g. after being uncovered
+        self.exposed = False
+
+        # ms the current frame advanced the clock by, taken from the recording while replaying
+        self.dt = 0
+        self.recorder = None
+        self.player = None
+
+        # motion events are only let through while an app wants every one of them
+        self.raw_motion = False
+        self.filter_events()
+
+    # needs the display, VirtualOS.boot calls it again once the window is open
+    def filter_events(self):
+        if not pg.display.get_init():
+            return
+        pg.event.set_blocked(None)
+        pg.event.set_allowed(self.EVENTS + ([pg.MOUSEMOTION] if self.raw_motion else []))
+
+    def set_raw_motion(self, raw_motion):
+        if raw_motion == self.raw_motion:
+            return
+        self.raw_motion = raw_motion
+        self.filter_events()
+        if not raw_motion:
+            pg.event.clear(pg.MOUSEMOTION)
+
+    def record(self, path, res = (0, 0), seed = 0):
+        self.stop_recording()
+        self.recorder = Recorder(path, res, seed)
+
+    # the recorder that was stopped, if there was one
+    def stop_recording(self):
+        recorder, self.recorder = self.recorder, None
+        return recorder
+
+    # SDL events are ignored until the recording runs out, except for quitting
+    def replay(self, data):
+        self.player = Replay(data)
+        return self.player.res, self.player.seed
+
+    # blocks until an event arrives or timeout ms have passed, 0 waits forever
+    def wait(self, timeout = 0):
+        # pygame only takes whole ms, rounded up so the deadline has passed when it returns
+        event = pg.event.wait(max(1, ceil(timeout)) if timeout else 0)
+        if event.type != pg.NOEVENT:
+            self.waited.append(event)
+
+    # dt is how many ms passed since the last update
+    def update(self, dt = 0):
         self.scroll = 0
-        self.keys_inst = []
+        self.keys_inst = set()
         self.click_inst = False
-        for event in pg.event.get():
+        self.exposed = False
+        self.events = []
+        events = self.waited + pg.event.get()
+        self.waited = []
+        mouse = None
+        if self.player:
+            if any(event.type == pg.QUIT for event in events):
+                self.quit = True
+            frame = self.player.next_frame()
+            if frame:
+                dt, mouse, events = frame
+            else:
+                self.player = None
+                events = []
+        self.dt = dt
+        for event in events:
             if event.type == pg.TEXTINPUT:
-                self.text += event.text
-                
-            if event.type == pg.KEYDOWN:
-                
-                self.keys_inst.append(event.key)
-                self.keys.append(event.key)
-                
-                if event.key == pg.K_BACKSPACE and self.text:
-                    self.text = self.text[:-1]
-            
+                self.events.append(TextInput(event.text))
+
+            elif event.type == pg.KEYDOWN:
+                self.keys_inst.add(event.key)
+                self.keys.add(event.key)
+                self.events.append(KeyDown(event.key, event.mod, event.unicode))
+
             elif event.type == pg.KEYUP:
-                if event.key in self.keys:
-                    self.keys.remove(event.key)
+                self.keys.discard(event.key)
+                self.events.append(KeyUp(event.key, event.mod))
 
             elif event.type == pg.MOUSEBUTTONDOWN:
                 self.click_inst = True
                 self.click = True
+                # click handlers need the position of this click, not the last frame's
+                self.mouse = event.pos
                 for fun in self.on_click:
                     fun()
+                self.events.append(MouseDown(event.pos, event.button))
 
             elif event.type == pg.MOUSEBUTTONUP:
                 self.click = False
+                self.events.append(MouseUp(event.pos, event.button))
 
             elif event.type == pg.MOUSEWHEEL:
                 self.scroll = event.y
-            
+                self.events.append(MouseWheel(event.x, event.y))
+
+            elif event.type == pg.MOUSEMOTION:
+                self.events.append(MouseMotion(event.pos, event.rel, event.buttons))
+
+            elif event.type in (pg.WINDOWEXPOSED, pg.VIDEOEXPOSE):
+                self.exposed = True
+
             elif event.type == pg.QUIT:
                 self.quit = True
-        self.mouse = pg.mouse.get_pos()
+        self.mouse = mouse if mouse else pg.mouse.get_pos()
+        if self.recorder:
+            self.recorder.frame(dt, self.mouse, events)
+
+# the input of one app, built only from the events routed to it, so apps can't see or change each other's input
+class AppInput:
+    def __init__(self, input):
+        self.input = input
+        self.queue = []
+        self.events = []
+
+        self.keys_inst = set()
+        self.keys = set()
+
+        # typed text, apps set it to "" once they used it
+        self.text = ""
+
+        self.click_inst = False
+        self.click = False
+        self.scroll = 0
+
+    @property
+    def mouse(self):
+        return self.input.mouse
+
+    def push(self, event):
+        self.queue.append(event)
+
+    # forgets held keys and queued events, e.g. when the app loses focus
+    def reset(self):
+        self.queue = []
+        self.keys.clear()
+        self.click = False
+
+    def update(self):
+        if not self.queue and not self.events:
+            return
+        self.events, self.queue = self.queue, []
+        self.keys_inst = set()
+        self.click_inst = False
+        self.scroll = 0
+        for event in self.events:
+            if isinstance(event, TextInput):
+                self.text += event.text
+
+            elif isinstance(event, KeyDown):
+                self.keys_inst.add(event.key)
+                self.keys.add(event.key)
+                if event.key == pg.K_BACKSPACE and self.text:
+                    self.text = self.text[:-1]
+
+            elif isinstance(event, KeyUp):
+                self.keys.discard(event.key)
+
+            elif isinstance(event, MouseDown):
+                self.click_inst = True
+                self.click = True
+
+            elif isinstance(event, MouseUp):
+                self.click = False
+
+            elif isinstance(event, MouseWheel):
+                self.scroll += event.y
@@ -0,0 +1,396 @@
+from os import environ
+from multiprocessing import get_context, shared_memory
+from copy import copy
+from collections import deque
+from signal import signal, SIGTERM, SIG_DFL
+import traceback
+import gc
+
+from virtualOS import *
+from vfs import DiskFS
+
+# pygame must not be initialised in a forked copy of the compositor
+context = get_context('spawn')
+
+# the layout of a 32 bit surface's pixels in memory, for the formats frombuffer takes. others get converted on blits
+def buffer_format(srf):
+    masks = srf.get_masks()[:3]
+    if srf.get_bytesize() == 4 and masks == (0xff, 0xff00, 0xff0000):
+        return 'RGBA'
+    return 'BGRA'
+
+# a surface over w*h pixels of the shared buffer starting at offset, the pixels are never copied
+def wrap(shm, res, offset = 0, fmt = 'BGRA'):
+    w, h = res
+    srf = pg.image.frombuffer(shm.buf[offset:offset + w*h*4], (w, h), fmt)
+    # with alpha off it's blitted like any opaque surface
+    srf.set_alpha(None)
+    return srf
+
+# a window whose app runs in a child process, so a slow or crashing app can't stall or take down the compositor.
+# the shared buffer holds two frames: the child copies what it drew into the one the compositor isn't showing,
+# and only writes the other one again after the compositor acknowledged switching to the new frame
+class ProcessApp(WindowApp):
+    def __init__(self, name, vos, path):
+        super().__init__(name, vos, vos.res)
+        self.app_path = path
+        self.shm = None
+        self.conn = None
+        self.process = None
+        self.alive = False
+        # hidden until the child tells us the app's size
+        self.visible = False
+        # the child reports what it drew
+        self.reports_damage = True
+        self.sent_mouse = None
+        self.sent_focus = False
+        # vos.time at which the child should have sent its next frame
+        self.wake_at = None
+        # the buffer with the last complete frame, and a surface over each buffer
+        self.front = 0
+        self.views = []
+        self.format = 'BGRA'
+
+    def run(self):
+        # each buffer is big enough for the app to go fullscreen
+        w, h = self.vos.res
+        self.half = w*h*4
+        self.shm = shared_memory.SharedMemory(create=True, size=2 * self.half)
+        self.format = buffer_format(self.vos.screen) if self.vos.screen else 'BGRA'
+        self.make_views()
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=child_main, daemon=True, name=self.name,
+                                       args=(self.name, self.app_path, self.vos.fs, self.vos.res, self.shm.name,
+                                             self.format, child_conn))
+        # the child only draws into memory, it never opens a window or plays sound
+        old_env = {key: environ.get(key) for key in ('SDL_VIDEODRIVER', 'SDL_AUDIODRIVER')}
+        environ.update(SDL_VIDEODRIVER='dummy', SDL_AUDIODRIVER='dummy')
+        try:
+            self.process.start()
+        finally:
+            for key, value in old_env.items():
+                if value is None:
+                    del environ[key]
+                else:
+                    environ[key] = value
+        child_conn.close()
+        self.alive = True
+        super().run()
+
+    def make_views(self):
+        self.views = [wrap(self.shm, self.res, i * self.half, self.format) for i in range(2)]
+        self.srf = self.views[self.front]
+
+    def send(self, message):
+        try:
+            self.conn.send(message)
+        except (OSError, ValueError):
+            self.crashed("lost the connection to the app")
+
+    # mouse event positions are made relative to the app, like self.mouse
+    def relative(self, event):
+        if not hasattr(event, 'pos'):
+            return event
+        event = copy(event)
+        x, y = event.pos
+        event.pos = (x - self.pos[0], y - self.pos[1])
+        return event
+
+    # input for the child, then everything the child sent since the last frame
+    def sync(self):
+        if not self.alive:
+            return
+        mouse = self.mouse
+        if self.can_update:
+            if self.input.events or mouse != self.sent_mouse or not self.sent_focus:
+                self.send(('input', mouse, [self.relative(event) for event in self.input.events], True))
+                self.sent_mouse, self.sent_focus = mouse, True
+        elif self.sent_focus:
+            self.send(('input', mouse, [], False))
+            self.sent_focus = False
+        self.receive()
+        if self.alive and not self.process.is_alive():
+            self.crashed(f"the app exited with code {self.process.exitcode}")
+        elif self.wake_at is not None and self.vos.time >= self.wake_at:
+            # the child's frame hasn't arrived yet, keep looking for it
+            self.vos.request_frame(1000 // self.vos.fps)
+
+    def receive(self):
+        while self.alive:
+            try:
+                if not self.conn.poll():
+                    return
+                message = self.conn.recv()
+            except (EOFError, OSError):
+                self.crashed("lost the connection to the app")
+                return
+            kind = message[0]
+            if kind in ('frame', 'status'):
+                if kind == 'frame':
+                    self.show(message[1], tuple(message[2]), message[3])
+                self.animating, wake = message[-2:]
+                self.wake_at = self.vos.time + wake if wake is not None else None
+                if wake is not None:
+                    self.vos.request_frame(wake)
+            elif kind == 'ready':
+                self.can_minimize = message[2]
+                self.resized(message[1])
+                self.visible = True
+            elif kind == 'run':
+                self.vos.run(message[1])
+            elif kind == 'open':
+                self.vos.open_path(message[1])
+            elif kind == 'prompt':
+                self.prompt(*message[1:])
+            elif kind == 'invalidate':
+                self.vos.fs.invalidate(message[1])
+            elif kind == 'log':
+                self.vos.log(message[1])
+            elif kind == 'error':
+                self.crashed(message[1])
+            elif kind == 'closed':
+                self.close()
+
+    # switches to the buffer the child just finished, the other one is the child's again once it's acknowledged
+    def show(self, front, res, rects):
+        old = self.srf
+        self.front = front
+        if res != self.res:
+            self.resized(res)
+        else:
+            self.srf = self.views[front]
+            # the compositor would redraw the whole window for a new surface at the same place
+            self.vos.old_display_list = [(self.srf, dest) if srf is old else (srf, dest)
+                                         for srf, dest in self.vos.old_display_list]
+            for rect in rects:
+                self.damage(rect)
+        self.send(('ack',))
+
+    def resized(self, res):
+        self.res = tuple(res)
+        self.center()
+        self.make_views()
+        self.make_tab_srf()
+        self.damage()
+
+    # prompts opened by the app are shown here, the answer goes back to the child
+    def prompt(self, prompt_id, text):
+        PromptApp("prompt", self.vos, text, lambda answer: self.alive and self.send(('prompted', prompt_id, answer))).run()
+
+    # the window stays open with a message so it can be closed like any other
+    def crashed(self, reason):
+        if not self.alive:
+            return
+        self.alive = False
+        self.animating = False
+        self.wake_at = None
+        self.vos.log(f"{self.name} crashed: {reason}\n")
+        if self.process.is_alive():
+            self.process.kill()
+        self.visible = True
+        self.srf.fill(self.bg)
+        msg = render_text(self.vos.font, f"{self.name} crashed", True, (255, 255, 255))
+        self.srf.blit(msg, (self.res[0]//2 - msg.get_width()//2, self.res[1]//2 - msg.get_height()//2))
+        self.damage()
+
+    # polls the child even while the window is still hidden
+    def render(self):
+        self.dead_render()
+
+    def dead_render(self):
+        self.sync()
+        if self in self.vos.apps:
+            super().dead_render()
+
+    # the window goes away right away, the child gets a second to exit on its own
+    def close(self):
+        if self.alive:
+            self.alive = False
+            self.send(('close',))
+            self.reap(self.vos.time + 1000)
+        self.conn.close()
+        super().close()
+        # the compositor forgets the surfaces over the buffer and redraws where they were instead
+        self.vos.damage(self.full_rect)
+        old = set(self.views + [self.tab_srf])
+        self.vos.display_list = [entry for entry in self.vos.display_list if entry[0] not in old]
+        self.vos.old_display_list = [entry for entry in self.vos.old_display_list if entry[0] not in old]
+        self.srf = None
+        self.views = []
+        self.shm.unlink()
+        self.free_buffer()
+
+    # a hung app never reads the close message
+    def reap(self, deadline):
+        if not self.process.is_alive():
+            self.process.join()
+        elif self.vos.time >= deadline:
+            self.process.kill()
+            self.process.join()
+        else:
+            self.vos.schedule(1000 // self.vos.fps, lambda: self.reap(deadline))
+
+    # the buffer can only be unmapped once the compositor dropped every surface over it
+    def free_buffer(self):
+        try:
+            self.shm.close()
+        except BufferError:
+            self.vos.schedule(1000 // self.vos.fps, self.free_buffer)
+
+
+# runs in the child: a VirtualOS without a window that updates one app and copies what it draws into the shared buffer
+def child_main(name, path, fs, screen_res, shm_name, fmt, conn):
+    shm = shared_memory.SharedMemory(shm_name)
+    pg.display.set_mode((1, 1))
+    # sdl turns SIGTERM into a quit event the app never reads, terminate() has to stop the process
+    signal(SIGTERM, SIG_DFL)
+    try:
+        host(name, path, fs, screen_res, shm, fmt, conn)
+    except (EOFError, OSError, KeyboardInterrupt):
+        pass
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+    finally:
+        # every surface over the buffer has to be gone before it can be unmapped
+        gc.collect()
+        shm.close()
+
+def host(name, path, fs, screen_res, shm, fmt, conn):
+    vos = VirtualOS(screen_res, filesystem=fs)
+    # other apps open in the compositor, an app started here would never be shown
+    def run(name, isolated = False):
+        conn.send(('run', name))
+        return 1
+    def open_path(path):
+        conn.send(('open', path))
+        return True
+    vos.run = run
+    vos.open_path = open_path
+    # the compositor's DiskFS has its own caches, it's told what the app changed
+    changes = deque()
+    if isinstance(vos.fs, DiskFS):
+        vos.fs.on_change = changes.append
+    App = import_app(vos.filesystem + path, name, vos.load(path))
+    app = App(name, vos)
+    app.run()
+    app.pos = (0, 0)
+    app.can_update = False
+    conn.send(('ready', app.res, app.can_minimize))
+    serve(vos, app, Frames(shm, screen_res, fmt, conn), conn, changes)
+
+# the child's side of the two buffers
+class Frames:
+    def __init__(self, shm, screen_res, fmt, conn):
+        self.shm = shm
+        self.half = screen_res[0] * screen_res[1] * 4
+        self.format = fmt
+        self.conn = conn
+        # the buffer the compositor shows, and whether it acknowledged showing it
+        self.front = 1
+        self.acked = True
+        # what changed since the last frame, and what the last frame changed, which the other buffer lacks
+        self.pending = []
+        self.last = []
+        self.res = None
+        # (animating, vos.time of the next wake up) the compositor was told about
+        self.status = None
+
+    def damage(self, rects):
+        self.pending.extend(rects)
+
+    # copies what changed into the back buffer and hands it over, once the compositor is done with it.
+    # wake is the vos.time of the app's next timer
+    def publish(self, app, animating, wake, now):
+        size = app.srf.get_size()
+        full = pg.Rect((0, 0), size)
+        if size != self.res:
+            self.res = size
+            self.pending = [full]
+            self.last = [full]
+        status = (animating, wake)
+        delay = wake - now if wake is not None else None
+        if not self.pending or not self.acked:
+            if status != self.status:
+                self.conn.send(('status', animating, delay))
+                self.status = status
+            return
+        self.status = status
+        back = 1 - self.front
+        view = wrap(self.shm, size, back * self.half, self.format)
+        for rect in merge_rects(self.last + self.pending, full):
+            view.blit(app.srf, rect, rect)
+        del view
+        rects = [tuple(rect) for rect in merge_rects(self.pending, full)]
+        self.conn.send(('frame', back, size, rects, animating, delay))
+        self.front = back
+        self.acked = False
+        self.last, self.pending = self.pending, []
+
+def serve(vos, app, frames, conn, changes):
+    clock = pg.time.Clock()
+    logged = len(vos.LOG)
+    # callbacks of prompts the compositor is showing
+    prompts = {}
+    while True:
+        # sleep until the compositor sends something or the app's next timer is due, unless it's animating.
+        # a frame that's waiting for the back buffer goes out once the compositor acknowledges the last one
+        if app.animating and app.can_update:
+            timeout = 0
+        else:
+            wake = vos.next_wake()
+            timeout = max(0, wake - vos.time) / 1000 if wake is not None else None
+            # the file queue's wake up events go to SDL, which the child doesn't wait on
+            if vos.io.busy:
+                timeout = min(timeout, 1 / vos.fps) if timeout is not None else 1 / vos.fps
+        if conn.poll(timeout):
+            while conn.poll():
+                message = conn.recv()
+                if message[0] == 'input':
+                    vos.input.mouse, events, app.can_update = message[1:]
+                    for event in events:
+                        app.input.push(event)
+                elif message[0] == 'ack':
+                    frames.acked = True
+                elif message[0] == 'prompted':
+                    vos.call(prompts.pop(message[1]), message[2])
+                elif message[0] == 'close':
+                    app.close()
+                    return
+        vos.time += clock.tick(vos.fps if app.animating and app.can_update else 0)
+        if vos.wake_time is not None and vos.wake_time <= vos.time:
+            vos.wake_time = None
+        vos.io.deliver()
+        vos.run_timers()
+        vos.step_tasks()
+        if app.can_update:
+            app.input.update()
+            app.update()
+        if app not in vos.apps:
+            conn.send(('closed',))
+            return
+        # windows the app opened: prompts are shown by the compositor, anything else can't be shown at all
+        for other in [other for other in vos.apps if other is not app]:
+            other.close()
+            if isinstance(other, PromptApp):
+                prompts[id(other)] = other.callback
+                conn.send(('prompt', id(other), other.prompt))
+            else:
+                vos.log(f"{app.name} runs isolated and can't open the window {other.name}\n")
+        # resizing centers the app on the child's screen, it's moved back into the corner
+        if app.pos != (0, 0):
+            app.pos = (0, 0)
+        vos.display_list = []
+        if app.can_update:
+            app.render()
+        else:
+            app.dead_render()
+        while changes:
+            conn.send(('invalidate', changes.popleft()))
+        # the file queue's worker may log in between, so the length is taken from the same string
+        log = vos.LOG
+        if len(log) > logged:
+            conn.send(('log', log[logged:]))
+            logged = len(log)
+        frames.damage(vos.damaged)
+        vos.damaged = []
+        frames.publish(app, app.animating, vos.next_wake(), vos.time)
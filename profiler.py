@@ -0,0 +1,87 @@
+from time import perf_counter
+from collections import deque
+import json, csv, io
+
+import pygame as pg
+
+
+class Profiler:
+    def __init__(self, size = 600):
+        # ring buffer of the last frames, each one holds the time every app spent updating and rendering
+        self.frames = deque(maxlen=size)
+        self.frame = None
+        self.count = 0
+        self.started = 0
+
+        self.visible = False
+        self.hud_frames = 60
+        self.hud_apps = 8
+        self.bg = (0, 0, 0, 190)
+        self.color = (0, 255, 0)
+
+    def start_frame(self, time):
+        self.frame = {'frame': self.count, 'time': time, 'frame_ms': 0, 'fps': 0, 'apps': {}}
+        self.count += 1
+        self.started = perf_counter()
+
+    # phase is 'update' or 'render', seconds as returned by perf_counter
+    def measure(self, name, phase, seconds):
+        if not self.frame:
+            return
+        times = self.frame['apps'].setdefault(name, {'update': 0.0, 'render': 0.0})
+        times[phase] += seconds * 1000
+
+    def end_frame(self, fps):
+        if not self.frame:
+            return
+        self.frame['frame_ms'] = (perf_counter() - self.started) * 1000
+        self.frame['fps'] = fps
+        self.frames.append(self.frame)
+        self.frame = None
+
+    def recent(self, n):
+        return list(self.frames)[-n:]
+
+    # average ms per frame each app spent updating and rendering, slowest first
+    def app_averages(self, n):
+        frames = self.recent(n)
+        totals = {}
+        for frame in frames:
+            for name, times in frame['apps'].items():
+                update, render = totals.get(name, (0, 0))
+                totals[name] = (update + times['update'], render + times['render'])
+        averages = [(name, update / len(frames), render / len(frames)) for name, (update, render) in totals.items()]
+        return sorted(averages, key=lambda avg: avg[1] + avg[2], reverse=True)
+
+    def to_json(self):
+        return json.dumps(list(self.frames), indent=1)
+
+    def to_csv(self):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(['frame', 'time', 'frame_ms', 'fps', 'app', 'update_ms', 'render_ms'])
+        for frame in self.frames:
+            for name, times in frame['apps'].items():
+                writer.writerow([frame['frame'], frame['time'], round(frame['frame_ms'], 3), round(frame['fps'], 1),
+                                 name, round(times['update'], 3), round(times['render'], 3)])
+        return out.getvalue()
+
+    # extra lines are shown below the frame times
+    def render_hud(self, font, extra = ()):
+        frames = self.recent(self.hud_frames)
+        if frames:
+            frame_ms = [frame['frame_ms'] for frame in frames]
+            lines = [f"FPS {frames[-1]['fps']:5.1f}  frame {sum(frame_ms)/len(frame_ms):6.2f} ms  max {max(frame_ms):6.2f} ms",
+                     f"{'app':20} {'update':>8} {'render':>8}"]
+            for name, update, render in self.app_averages(self.hud_frames)[:self.hud_apps]:
+                lines.append(f"{name[:20]:20} {update:8.2f} {render:8.2f}")
+        else:
+            lines = ["no frames recorded yet"]
+        lines += extra
+        rendered = [font.render(line, True, self.color) for line in lines]
+        line_height = font.get_linesize()
+        srf = pg.Surface((max(line.get_width() for line in rendered) + 10, line_height * len(lines) + 10), pg.SRCALPHA)
+        srf.fill(self.bg)
+        for i, line in enumerate(rendered):
+            srf.blit(line, (5, 5 + i * line_height))
+        return srf
@@ -0,0 +1,155 @@
+from random import random
+
+# a document stored as a treap of lines ordered by position, so finding, inserting
+# and deleting a line takes O(log n) no matter how long the document is
+class Line:
+    __slots__ = ('text', 'priority', 'size', 'left', 'right')
+    def __init__(self, text):
+        self.text = text
+        self.priority = random()
+        self.size = 1
+        self.left = None
+        self.right = None
+
+def size(node):
+    return node.size if node else 0
+
+def fix(node):
+    node.size = 1 + size(node.left) + size(node.right)
+    return node
+
+# splits into the first index lines and the rest
+def split(node, index):
+    if not node:
+        return None, None
+    if size(node.left) < index:
+        left, right = split(node.right, index - size(node.left) - 1)
+        node.right = left
+        return fix(node), right
+    left, right = split(node.left, index)
+    node.left = right
+    return left, fix(node)
+
+def merge(left, right):
+    if not left or not right:
+        return left or right
+    if left.priority > right.priority:
+        left.right = merge(left.right, right)
+        return fix(left)
+    right.left = merge(left, right.left)
+    return fix(right)
+
+# builds the treap in O(n) by keeping the right edge of the tree on a stack
+def build(lines):
+    stack = []
+    for text in lines:
+        node = Line(text)
+        last = None
+        while stack and stack[-1].priority < node.priority:
+            last = fix(stack.pop())
+        node.left = last
+        if stack:
+            stack[-1].right = node
+        stack.append(node)
+    for node in reversed(stack):
+        fix(node)
+    return stack[0] if stack else None
+
+class TextBuffer:
+    def __init__(self, lines = ('',)):
+        self.root = build(lines)
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(text.split('\n'))
+
+    def __len__(self):
+        return size(self.root)
+
+    def index(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("line index out of range")
+        return i
+
+    def node(self, i):
+        i = self.index(i)
+        node = self.root
+        while True:
+            left = size(node.left)
+            if i < left:
+                node = node.left
+            elif i == left:
+                return node
+            else:
+                i -= left + 1
+                node = node.right
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, step = i.indices(len(self))
+            return list(self.lines(start, stop))[::step]
+        return self.node(i).text
+
+    def __setitem__(self, i, text):
+        self.node(i).text = text
+
+    def __delitem__(self, i):
+        i = self.index(i)
+        left, right = split(self.root, i)
+        _, right = split(right, 1)
+        self.root = merge(left, right)
+
+    def insert(self, i, text):
+        n = len(self)
+        i = max(0, min(i + n if i < 0 else i, n))
+        left, right = split(self.root, i)
+        self.root = merge(merge(left, Line(text)), right)
+
+    def append(self, text):
+        self.insert(len(self), text)
+
+    # yields the lines from start to stop without walking the lines before start
+    def lines(self, start = 0, stop = None):
+        stop = len(self) if stop is None else min(stop, len(self))
+        if start >= stop:
+            return
+        stack = []
+        node = self.root
+        i = start
+        while node:
+            left = size(node.left)
+            if i < left:
+                stack.append(node)
+                node = node.left
+            elif i == left:
+                stack.append(node)
+                break
+            else:
+                i -= left + 1
+                node = node.right
+        for _ in range(stop - start):
+            node = stack.pop()
+            yield node.text
+            node = node.right
+            while node:
+                stack.append(node)
+                node = node.left
+
+    def __iter__(self):
+        return self.lines()
+
+    # the document in chunks, for saving without joining it into one string
+    def iter_text(self):
+        first = True
+        for line in self.lines():
+            if not first:
+                yield '\n'
+            first = False
+            yield line
+
+    @property
+    def text(self):
+        return '\n'.join(self.lines())
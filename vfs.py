@@ -0,0 +1,289 @@
+from os import listdir, mkdir, remove, rename, stat, fsync as os_fsync
+from os.path import join, isdir
+from stat import S_ISDIR
+from shutil import rmtree
+from threading import RLock
+from io import BytesIO
+from time import time
+
+# the filesystems VirtualOS reads and writes through. paths are relative to the filesystem's root, with or
+# without slashes at either end. both are safe to use from the file queue's worker thread
+
+
+def normalize(path):
+    return '/'.join(part for part in path.split('/') if part)
+
+def parent(path):
+    return path.rpartition('/')[0]
+
+def to_bytes(data):
+    if isinstance(data, (bytes, bytearray)):
+        return bytes(data)
+    if isinstance(data, str):
+        return data.encode()
+    return b''.join(part.encode() if isinstance(part, str) else part for part in data)
+
+
+# the real folder at root. listings and stats are cached until a change made through it touches them,
+# changes made some other way are seen after invalidate()
+class DiskFS:
+    def __init__(self, root):
+        self.root = root if root.endswith('/') else root + '/'
+        self.lock = RLock()
+        self.listing_cache = {}
+        # path: (is folder, mtime), or None if nothing is there
+        self.stat_cache = {}
+        self.hits = 0
+        self.misses = 0
+        # called with the path of every change made through this filesystem, from whichever thread made it
+        self.on_change = None
+
+    # isolated apps get the same folder in their process
+    def __getstate__(self):
+        return {'root': self.root}
+
+    def __setstate__(self, state):
+        self.__init__(state['root'])
+
+    def stat(self, path):
+        path = normalize(path)
+        with self.lock:
+            if path in self.stat_cache:
+                self.hits += 1
+                return self.stat_cache[path]
+            self.misses += 1
+            try:
+                st = stat(self.root + path)
+                result = (S_ISDIR(st.st_mode), st.st_mtime)
+            except OSError:
+                result = None
+            self.stat_cache[path] = result
+            return result
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def isdir(self, path):
+        st = self.stat(path)
+        return bool(st and st[0])
+
+    def mtime(self, path):
+        st = self.stat(path)
+        if not st:
+            raise FileNotFoundError(path)
+        return st[1]
+
+    def listdir(self, path):
+        path = normalize(path)
+        with self.lock:
+            names = self.listing_cache.get(path)
+            if names is None:
+                self.misses += 1
+                names = self.listing_cache[path] = listdir(self.root + path)
+            else:
+                self.hits += 1
+            return list(names)
+
+    def read(self, path, binary = False):
+        with open(self.root + normalize(path), 'rb' if binary else 'r') as f:
+            return f.read()
+
+    # a file-like object, for loaders that take one
+    def open(self, path):
+        return BytesIO(self.read(path, True))
+
+    # data is a string, bytes or an iterable of them. with fsync the data is on the disk once this returns
+    def write(self, path, data, binary = False, fsync = False):
+        path = normalize(path)
+        try:
+            with open(self.root + path, 'wb' if binary else 'w') as f:
+                if isinstance(data, (str, bytes, bytearray)):
+                    f.write(data)
+                else:
+                    f.writelines(data)
+                if fsync:
+                    f.flush()
+                    os_fsync(f.fileno())
+        finally:
+            self.changed(path)
+
+    def mkdir(self, path):
+        mkdir(self.root + normalize(path))
+        self.changed(path)
+
+    # files and whole folders
+    def remove(self, path):
+        try:
+            if self.isdir(path):
+                rmtree(self.root + normalize(path))
+            else:
+                remove(self.root + normalize(path))
+        finally:
+            self.changed(path)
+
+    def rename(self, from_path, to_path):
+        try:
+            rename(self.root + normalize(from_path), self.root + normalize(to_path))
+        finally:
+            self.changed(from_path)
+            self.changed(to_path)
+
+    def changed(self, path):
+        self.invalidate(path)
+        if self.on_change:
+            self.on_change(path)
+
+    # forgets path, everything under it and its parent's listing, None forgets everything
+    def invalidate(self, path = None):
+        with self.lock:
+            path = normalize(path) if path is not None else ''
+            if not path:
+                self.listing_cache.clear()
+                self.stat_cache.clear()
+                return
+            prefix = path + '/'
+            for cache in (self.listing_cache, self.stat_cache):
+                for key in [key for key in cache if key == path or key.startswith(prefix)]:
+                    del cache[key]
+                cache.pop(parent(path), None)
+
+    def stats(self):
+        return f"disk fs {len(self.listing_cache)} listings {len(self.stat_cache)} stats {self.hits} hits {self.misses} misses"
+
+
+# folders are dicts and files are bytes, all in memory. fast and isolated filesystems for tests and benchmarks.
+# an isolated app gets a copy of it, its changes aren't seen by the other apps
+class MemoryFS:
+    root = None
+
+    def __init__(self):
+        self.lock = RLock()
+        self.tree = {}
+        self.mtimes = {}
+
+    # a copy of the real folder at root
+    @classmethod
+    def from_disk(cls, root):
+        fs = cls()
+        def copy(folder, node):
+            for name in listdir(folder):
+                path = join(folder, name)
+                if isdir(path):
+                    node[name] = {}
+                    copy(path, node[name])
+                else:
+                    with open(path, 'rb') as f:
+                        node[name] = f.read()
+        copy(root, fs.tree)
+        return fs
+
+    def __getstate__(self):
+        return {'tree': self.tree, 'mtimes': self.mtimes}
+
+    def __setstate__(self, state):
+        self.__init__()
+        self.tree, self.mtimes = state['tree'], state['mtimes']
+
+    def node(self, path):
+        node = self.tree
+        for part in normalize(path).split('/') if normalize(path) else []:
+            if not isinstance(node, dict) or part not in node:
+                return None
+            node = node[part]
+        return node
+
+    # the folder that holds path and the name of path in it
+    def parent_node(self, path):
+        path = normalize(path)
+        folder = self.node(parent(path))
+        if not isinstance(folder, dict):
+            raise FileNotFoundError(path)
+        return folder, path.rpartition('/')[2]
+
+    def stat(self, path):
+        with self.lock:
+            node = self.node(path)
+            if node is None:
+                return None
+            return (isinstance(node, dict), self.mtimes.get(normalize(path), 0))
+
+    def exists(self, path):
+        return self.stat(path) is not None
+
+    def isdir(self, path):
+        st = self.stat(path)
+        return bool(st and st[0])
+
+    def mtime(self, path):
+        st = self.stat(path)
+        if not st:
+            raise FileNotFoundError(path)
+        return st[1]
+
+    def listdir(self, path):
+        with self.lock:
+            node = self.node(path)
+            if node is None:
+                raise FileNotFoundError(path)
+            if not isinstance(node, dict):
+                raise NotADirectoryError(path)
+            return list(node)
+
+    def read(self, path, binary = False):
+        with self.lock:
+            node = self.node(path)
+        if node is None:
+            raise FileNotFoundError(path)
+        if isinstance(node, dict):
+            raise IsADirectoryError(path)
+        return node if binary else node.decode()
+
+    def open(self, path):
+        return BytesIO(self.read(path, True))
+
+    def write(self, path, data, binary = False, fsync = False):
+        data = to_bytes(data)
+        with self.lock:
+            folder, name = self.parent_node(path)
+            if isinstance(folder.get(name), dict):
+                raise IsADirectoryError(path)
+            folder[name] = data
+            self.mtimes[normalize(path)] = time()
+
+    def mkdir(self, path):
+        with self.lock:
+            folder, name = self.parent_node(path)
+            if name in folder:
+                raise FileExistsError(path)
+            folder[name] = {}
+            self.mtimes[normalize(path)] = time()
+
+    def remove(self, path):
+        with self.lock:
+            folder, name = self.parent_node(path)
+            if name not in folder:
+                raise FileNotFoundError(path)
+            del folder[name]
+
+    def rename(self, from_path, to_path):
+        with self.lock:
+            folder, name = self.parent_node(from_path)
+            if name not in folder:
+                raise FileNotFoundError(from_path)
+            to_folder, to_name = self.parent_node(to_path)
+            to_folder[to_name] = folder.pop(name)
+            self.mtimes[normalize(to_path)] = time()
+
+    def invalidate(self, path = None):
+        pass
+
+    def stats(self):
+        files, size = 0, 0
+        stack = [self.tree]
+        while stack:
+            for node in stack.pop().values():
+                if isinstance(node, dict):
+                    stack.append(node)
+                else:
+                    files, size = files + 1, size + len(node)
+        return f"memory fs {files} files {size / 2**20:.1f} MB"
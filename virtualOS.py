@@ -1,10 +1,22 @@
-from os import environ, mkdir, listdir, remove, rename
+from os import environ, makedirs, replace, path as os_path
 environ['PYGAME_HIDE_SUPPORT_PROMPT'] = "TRUE"
-from os.path import isdir, exists
-from shutil import rmtree as rmdir
-
-from pg_input import Input
+from heapq import heappush, heappop
+from time import perf_counter
+import time
+import random
+from collections import OrderedDict, deque
+from hashlib import md5
+import struct
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from threading import Lock, Condition, Thread, current_thread
+import asyncio
+import traceback
+
+from pg_input import Input, AppInput, KEYBOARD_EVENTS, MouseMotion, FILE_IO, read_header
+from text_buffer import TextBuffer
+from profiler import Profiler
 from app_loader import import_app
+from vfs import DiskFS, MemoryFS
 
 import pygame as pg
 pg.init()
@@ -16,8 +28,588 @@ def point_within_rect(point, rect):
     x, y, w, h = rect
     return x <= px < x + w and y <= py < y + h
 
+# joins overlapping rects so every pixel is redrawn once, falls back to the whole screen if most of it changed
+def merge_rects(rects, bounds):
+    merged = []
+    for rect in rects:
+        rect = pg.Rect(rect).clip(bounds)
+        if not rect:
+            continue
+        i = rect.collidelist(merged)
+        while i != -1:
+            rect.union_ip(merged.pop(i))
+            i = rect.collidelist(merged)
+        merged.append(rect)
+    if sum(rect.w * rect.h for rect in merged) > bounds.w * bounds.h // 2:
+        return [pg.Rect(bounds)]
+    return merged
+
+# the parts of rect outside of cut, as up to four rects
+def subtract_rect(rect, cut):
+    rect = pg.Rect(rect)
+    cut = rect.clip(cut)
+    if not cut:
+        return [rect]
+    parts = [
+        (rect.x, rect.y, rect.w, cut.y - rect.y), # above
+        (rect.x, cut.bottom, rect.w, rect.bottom - cut.bottom), # below
+        (rect.x, cut.y, cut.x - rect.x, cut.h), # left
+        (cut.right, cut.y, rect.right - cut.right, cut.h), # right
+        ]
+    return [pg.Rect(part) for part in parts if part[2] > 0 and part[3] > 0]
+
+# the parts of rect not hidden behind any of the covers
+def visible_parts(rect, covers):
+    parts = [pg.Rect(rect)]
+    for cover in covers:
+        parts = [part for old in parts for part in subtract_rect(old, cover)]
+        if not parts:
+            break
+    return parts
+
+def is_opaque(srf):
+    return not srf.get_flags() & pg.SRCALPHA and srf.get_alpha() in (None, 255) and srf.get_colorkey() is None
+
+# rendered text shared by all apps, the surfaces it hands out must not be drawn on
+class TextCache:
+    def __init__(self, max_bytes = 16 * 2**20):
+        self.surfaces = OrderedDict()
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, antialias, color, background = None):
+        # the font object stands for its file and size
+        key = (font, text, tuple(color), tuple(background) if background else None, antialias)
+        srf = self.surfaces.get(key)
+        if srf is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return srf
+        self.misses += 1
+        srf = convert(font.render(text, antialias, color, background))
+        self.surfaces[key] = srf
+        self.bytes += self.size(srf)
+        while self.bytes > self.max_bytes and len(self.surfaces) > 1:
+            _, old = self.surfaces.popitem(last=False)
+            self.bytes -= self.size(old)
+        return srf
+
+    def size(self, srf):
+        return srf.get_width() * srf.get_height() * srf.get_bytesize()
+
+    def clear(self):
+        self.surfaces.clear()
+        self.bytes = 0
+
+    def stats(self):
+        return f"text cache {self.hits} hits {self.misses} misses {len(self.surfaces)} surfaces {self.bytes / 2**20:.1f} MB"
+
+text_cache = TextCache()
+
+# surfaces in the display's pixel format, so blitting them to the screen needs no conversion.
+# released surfaces are handed out again for the next request of the same size
+class SurfacePool:
+    def __init__(self, max_free = 64):
+        self.free = {}
+        self.nfree = 0
+        self.max_free = max_free
+        # owner of every surface handed out, and the bytes each owner holds
+        self.owners = {}
+        self.bytes = {}
+        self.made = 0
+        self.reused = 0
+
+    def get(self, size, alpha = False, owner = None):
+        size = (int(size[0]), int(size[1]))
+        free = self.free.get((size, alpha))
+        if free:
+            srf = free.pop()
+            self.nfree -= 1
+            srf.fill((0, 0, 0, 0))
+            self.reused += 1
+        else:
+            srf = self.make(size, alpha)
+            self.made += 1
+        self.owners[srf] = owner
+        self.bytes[owner] = self.bytes.get(owner, 0) + self.size(srf)
+        return srf
+
+    def make(self, size, alpha):
+        screen = pg.display.get_surface()
+        if alpha:
+            srf = pg.Surface(size, pg.SRCALPHA)
+            return srf.convert_alpha() if screen else srf
+        return pg.Surface(size, 0, screen) if screen else pg.Surface(size)
+
+    def size(self, srf):
+        return srf.get_width() * srf.get_height() * srf.get_bytesize()
+
+    def release(self, srf):
+        if srf not in self.owners:
+            return
+        owner = self.owners.pop(srf)
+        self.bytes[owner] -= self.size(srf)
+        if not self.bytes[owner]:
+            del self.bytes[owner]
+        if self.nfree < self.max_free:
+            alpha = bool(srf.get_flags() & pg.SRCALPHA)
+            self.free.setdefault((srf.get_size(), alpha), []).append(srf)
+            self.nfree += 1
+
+    def release_owner(self, owner):
+        for srf in [srf for srf, o in self.owners.items() if o is owner]:
+            self.release(srf)
+
+    def stats(self):
+        held = sum(self.bytes.values())
+        return f"surfaces {len(self.owners)} in use {held / 2**20:.1f} MB {self.nfree} free {self.made} made {self.reused} reused"
+
+# text surfaces are kept in the display format too
+def convert(srf):
+    if not pg.display.get_surface():
+        return srf
+    return srf.convert_alpha() if srf.get_flags() & pg.SRCALPHA else srf.convert()
+
+def render_text(font, text, antialias, color, background = None):
+    return text_cache.render(font, text, antialias, color, background)
+
+# measured once per font so widgets don't have to render probe strings
+class FontMetrics:
+    def __init__(self, font):
+        self.font = font
+        self.line_height = font.get_height()
+        self.linesize = font.get_linesize()
+        self.ascent = font.get_ascent()
+        self.descent = font.get_descent()
+        self.advance = font.size("M")[0]
+        self.monospace = all(font.size(char)[0] == self.advance for char in "iW.")
+
+    def width(self, text):
+        return self.advance * len(text) if self.monospace else self.font.size(text)[0]
+
+# every (family, size, style) is loaded once and shared by all apps, family None is the bundled monospace font
+class FontRegistry:
+    def __init__(self, vos):
+        self.vos = vos
+        self.fonts = {}
+        self.metrics = {}
+
+    def get(self, family = None, size = 17, bold = False, italic = False):
+        key = (family, size, bold, italic)
+        font = self.fonts.get(key)
+        if font is None:
+            font = self.load(family, size, bold, italic)
+            self.fonts[key] = font
+        return font
+
+    def load(self, family, size, bold, italic):
+        if family is None:
+            font = pg.font.Font(self.vos.fs.open('fonts/monospace.otf'), size)
+            font.bold, font.italic = bold, italic
+            return font
+        return pg.font.SysFont(family, size, bold, italic)
+
+    # works for fonts that weren't loaded through the registry too
+    def measure(self, font):
+        metrics = self.metrics.get(font)
+        if metrics is None:
+            metrics = self.metrics[font] = FontMetrics(font)
+        return metrics
+
+# decoded images already converted to the display format and their scaled variants, keyed by the mtime vos.fs
+# reports so files saved through it get reloaded (files edited outside pygameOS only after fs.invalidate()).
+# scaled variants of files on a DiskFS are also kept as raw pixels in a host folder outside of vos.fs, so the
+# next launch skips the PNG decoder. the surfaces it hands out are shared and must not be drawn on
+class AssetCache:
+    THUMBNAIL_HEADER = struct.Struct('<dII?')
+    THUMBNAIL_DIR = os_path.join(os_path.dirname(os_path.abspath(__file__)), 'cache', 'thumbnails')
+
+    def __init__(self, vos, thumbnail_dir = THUMBNAIL_DIR, thumbnail_max = 256):
+        self.vos = vos
+        self.surfaces = {}
+        self.thumbnail_dir = thumbnail_dir
+        self.thumbnail_max = thumbnail_max
+        self.hits = 0
+        self.decodes = 0
+
+    def image(self, path, transparent = False, size = None, smooth = False):
+        try:
+            mtime = self.vos.fs.mtime(path)
+        except OSError:
+            return None
+        size = tuple(size) if size else None
+        key = (path, transparent, size, smooth)
+        cached = self.surfaces.get(key)
+        if cached and cached[0] == mtime:
+            self.hits += 1
+            return cached[1]
+        if size:
+            srf = self.load_thumbnail(key, mtime)
+            if not srf:
+                srf = self.image(path, transparent)
+                srf = (pg.transform.smoothscale if smooth else pg.transform.scale)(srf, size)
+                self.save_thumbnail(key, mtime, srf)
+        else:
+            srf = pg.image.load(self.vos.fs.open(path), path)
+            srf = srf.convert_alpha() if transparent else srf.convert()
+            self.decodes += 1
+        self.surfaces[key] = (mtime, srf)
+        return srf
+
+    # None when the filesystem isn't on disk, its thumbnails only live in memory
+    def thumbnail_path(self, key):
+        root = self.vos.fs.root
+        if root is None or not self.thumbnail_dir:
+            return None
+        return os_path.join(self.thumbnail_dir, md5(repr((root, key)).encode()).hexdigest() + '.raw')
+
+    # a header with the source file's mtime and the size, then the raw pixels
+    def load_thumbnail(self, key, mtime):
+        path = self.thumbnail_path(key)
+        if not path:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        header = self.THUMBNAIL_HEADER
+        if len(data) < header.size:
+            return None
+        saved_mtime, w, h, alpha = header.unpack_from(data)
+        fmt = 'RGBA' if alpha else 'RGB'
+        if saved_mtime != mtime or len(data) - header.size != w * h * len(fmt):
+            return None
+        srf = pg.image.frombytes(data[header.size:], (w, h), fmt)
+        return srf.convert_alpha() if alpha else srf.convert()
+
+    def save_thumbnail(self, key, mtime, srf):
+        w, h = srf.get_size()
+        if w > self.thumbnail_max or h > self.thumbnail_max:
+            return
+        path = self.thumbnail_path(key)
+        if not path:
+            return
+        alpha = key[1]
+        try:
+            makedirs(self.thumbnail_dir, exist_ok=True)
+            # isolated apps share the folder, so a thumbnail is never seen half written
+            with open(path + '.part', 'wb') as f:
+                f.write(self.THUMBNAIL_HEADER.pack(mtime, w, h, alpha))
+                f.write(pg.image.tobytes(srf, 'RGBA' if alpha else 'RGB'))
+            replace(path + '.part', path)
+        except OSError:
+            pass
+
+    def clear(self):
+        self.surfaces.clear()
+
+    def stats(self):
+        return f"assets {self.hits} hits {self.decodes} decodes {len(self.surfaces)} surfaces"
+
+class FileJob:
+    def __init__(self, kind, path, to_path = None, data = None):
+        self.kind, self.path, self.to_path, self.data = kind, path, to_path, data
+        self.callbacks = []
+        self.started = False
+        # progress in bytes for saves and in files and folders for copied folders
+        self.done = 0
+        self.total = 1
+
+# file operations done by a worker thread in the order they were queued, their callbacks get the result on the
+# main thread in VirtualOS.update. a save replaces the data of a save to the same path that hasn't started yet,
+# and loads get the data of saves that haven't finished
+class FileQueue:
+    def __init__(self, vos, chunk = 2**20):
+        self.vos = vos
+        self.chunk = chunk
+        self.jobs = deque()
+        self.current = None
+        # (callbacks, result) of finished jobs
+        self.finished = deque()
+        # the latest queued or running save of each path
+        self.writes = {}
+        self.lock = Lock()
+        self.wake = Condition(self.lock)
+        self.thread = None
+        self.posted = 0
+
+    # the lock has to be held
+    def queue(self, job, callback):
+        if callback:
+            job.callbacks.append(callback)
+        self.jobs.append(job)
+        self.wake.notify()
+        if not self.thread:
+            self.thread = Thread(target=self.work, name='file-io', daemon=True)
+            self.thread.start()
+        return job
+
+    def save(self, path, data, callback = None):
+        # taken now, so e.g. a TextBuffer can be edited while it's written
+        if data is not None and not isinstance(data, str):
+            data = ''.join(data)
+        with self.lock:
+            job = self.writes.get(path)
+            if job and not job.started:
+                job.data = data
+                job.total = max(1, len(data)) if data else 1
+                if callback:
+                    job.callbacks.append(callback)
+                return job
+            job = FileJob('save', path, data=data)
+            job.total = max(1, len(data)) if data else 1
+            self.writes[path] = job
+            return self.queue(job, callback)
+
+    def load(self, path, callback):
+        with self.lock:
+            job = self.writes.get(path)
+            if job:
+                # what the file will hold once the save is done
+                self.finished.append(([callback], job.data))
+                self.notify()
+                return job
+            return self.queue(FileJob('load', path), callback)
+
+    # from_path is a file, while to_path is a folder
+    def copy(self, from_path, to_path, callback = None):
+        with self.lock:
+            self.forget(from_path)
+            self.forget(to_path)
+            return self.queue(FileJob('copy', from_path, to_path), callback)
+
+    # folder paths must not end in a "/"
+    def copy_folder(self, from_path, to_path, callback = None):
+        with self.lock:
+            self.forget(from_path)
+            self.forget(to_path)
+            return self.queue(FileJob('copy_folder', from_path, to_path), callback)
+
+    def delete(self, path, callback = None):
+        with self.lock:
+            self.forget(path)
+            return self.queue(FileJob('delete', path), callback)
+
+    def rename(self, from_path, to_path, callback = None):
+        with self.lock:
+            self.forget(from_path)
+            self.forget(to_path)
+            return self.queue(FileJob('rename', from_path, to_path), callback)
+
+    # later saves under path can't be merged into earlier ones, a job queued in between uses the path
+    def forget(self, path):
+        for write in [write for write in self.writes if write == path or write.startswith(path.rstrip('/') + '/')]:
+            del self.writes[write]
+
+    @property
+    def busy(self):
+        return bool(self.jobs or self.current or self.finished)
+
+    # blocks until no queued or running job uses any of paths, so a change made right away doesn't get undone
+    def settle(self, *paths):
+        if current_thread() is self.thread:
+            return
+        paths = [path.rstrip('/') for path in paths]
+        def uses(job):
+            for job_path in (job.path, job.to_path):
+                if job_path is None:
+                    continue
+                job_path = job_path.rstrip('/')
+                for path in paths:
+                    if path == job_path or path.startswith(job_path + '/') or job_path.startswith(path + '/'):
+                        return True
+            return False
+        with self.lock:
+            while any(uses(job) for job in [self.current, *self.jobs] if job):
+                self.wake.wait()
+
+    # the running job and how many are queued after it, empty when there's nothing to do
+    def status(self):
+        with self.lock:
+            jobs = ([self.current] if self.current else []) + list(self.jobs)
+        if not jobs:
+            return ""
+        job = jobs[0]
+        text = f"{job.kind.replace('_', ' ')} {job.path} {100 * job.done // job.total}%"
+        if len(jobs) > 1:
+            text += f" ({len(jobs) - 1} more queued)"
+        return text
+
+    # runs the callbacks of finished jobs, called by VirtualOS.update
+    def deliver(self):
+        while self.finished:
+            callbacks, result = self.finished.popleft()
+            for callback in callbacks:
+                self.vos.call(callback, result)
+
+    # wakes up the idle loop, at most ten times a second for progress
+    def notify(self, progress = False):
+        if progress and perf_counter() - self.posted < 0.1:
+            return
+        self.posted = perf_counter()
+        if pg.display.get_init():
+            pg.event.post(pg.event.Event(FILE_IO))
+
+    def progress(self, job, amount):
+        job.done += amount
+        self.notify(True)
+
+    def work(self):
+        while True:
+            with self.lock:
+                while not self.jobs:
+                    self.wake.wait()
+                job = self.jobs.popleft()
+                job.started = True
+                self.current = job
+            if job.kind is None:
+                return
+            try:
+                result = getattr(self, 'do_' + job.kind)(job)
+            except Exception:
+                self.vos.log(traceback.format_exc())
+                result = False
+            job.done = job.total
+            with self.lock:
+                self.current = None
+                if self.writes.get(job.path) is job:
+                    del self.writes[job.path]
+                self.finished.append((job.callbacks, result))
+                # for settle
+                self.wake.notify_all()
+            self.notify()
+
+    def chunks(self, job):
+        for i in range(0, len(job.data), self.chunk):
+            yield job.data[i:i + self.chunk]
+            self.progress(job, min(self.chunk, len(job.data) - i))
+
+    # written in chunks to report progress, and on disk once the callback runs
+    def do_save(self, job):
+        return self.vos.save(job.path, job.data if job.data is None else self.chunks(job), fsync = True)
+
+    def do_load(self, job):
+        return self.vos.load(job.path)
+
+    def do_copy(self, job):
+        return self.vos.copy(job.path, job.to_path, fsync = True)
+
+    def do_delete(self, job):
+        return self.vos.delete(job.path)
+
+    def do_rename(self, job):
+        return self.vos.rename(job.path, job.to_path)
+
+    def do_copy_folder(self, job):
+        vos = self.vos
+        if not vos.isdir(job.path) or not vos.isdir(job.to_path):
+            vos.log(f"A folder path was invalid: '{job.path}' or '{job.to_path}'")
+            return False
+        copied = job.to_path + '/' + job.path.split('/')[-1]
+        # (folder relative to job.path, its files)
+        folders = []
+        def collect(folder):
+            names = vos.list_folder(job.path + folder) or []
+            subfolders = [name for name in names if vos.isdir(job.path + folder + '/' + name)]
+            folders.append((folder, [name for name in names if name not in subfolders]))
+            for name in subfolders:
+                collect(folder + '/' + name)
+        collect('')
+        job.total = max(1, sum(1 + len(files) for _, files in folders))
+        for folder, files in folders:
+            self.vos.make_folder(copied + folder)
+            self.progress(job, 1)
+            for file in files:
+                self.vos.copy(job.path + folder + '/' + file, copied + folder, fsync = True)
+                self.progress(job, 1)
+        return True
+
+    # waits for the queued jobs to be done, their callbacks don't run anymore
+    def close(self):
+        if self.thread:
+            with self.lock:
+                self.queue(FileJob(None, None), None)
+            self.thread.join()
+            self.thread = None
+
+# screen cells listing the visible windows over them from bottom to top, so finding the window under a point
+# only checks the windows in one cell. rebuilt lazily after a window moves, resizes, shows, hides or is raised
+class WindowIndex:
+    def __init__(self, vos, cell = 128):
+        self.vos = vos
+        self.cell = cell
+        self.cells = {}
+        self.dirty = True
+
+    def rebuild(self):
+        self.cells = {}
+        c = self.cell
+        W, H = self.vos.res
+        for app in self.vos.apps:
+            if 'WindowApp' not in app.flags or not app.visible or not app.srf:
+                continue
+            x, y, w, h = app.full_rect
+            for cx in range(max(0, x) // c, (min(W, x + w) - 1) // c + 1):
+                for cy in range(max(0, y) // c, (min(H, y + h) - 1) // c + 1):
+                    self.cells.setdefault((cx, cy), []).append(app)
+        self.dirty = False
+
+    def at(self, point):
+        if self.dirty:
+            self.rebuild()
+        for app in reversed(self.cells.get((point[0] // self.cell, point[1] // self.cell), ())):
+            if point_within_rect(point, app.full_rect):
+                return app
+
+# runs the updates of thread safe apps on worker threads, the frame waits for all of them before rendering
+class UpdatePool:
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(workers, thread_name_prefix='app-update')
+        self.futures = []
+        # ms the last update of each app took on its worker
+        self.times = {}
+
+    def submit(self, app):
+        self.futures.append((app, self.executor.submit(self.update, app)))
+
+    def update(self, app):
+        started = perf_counter()
+        app.input.update()
+        app.update()
+        return perf_counter() - started
+
+    # the frame barrier, returns (app, seconds) for every submitted update. the first app exception is raised
+    # here, once every other update has finished too
+    def wait(self):
+        futures, self.futures = self.futures, []
+        wait_futures([future for app, future in futures])
+        done = []
+        for app, future in futures:
+            seconds = future.result()
+            self.times[app.name] = seconds * 1000
+            done.append((app, seconds))
+        return done
+
+    def stats(self):
+        return f"update pool {self.workers} workers {len(self.times)} apps {sum(self.times.values()):.2f} ms"
+
+    def shutdown(self):
+        self.executor.shutdown()
+
+class Timer:
+    def __init__(self, fn, period = None):
+        self.fn = fn
+        self.period = period
+        self.cancelled = False
+    def cancel(self):
+        self.cancelled = True
+
 class VirtualOS:
-    def __init__(self, resolution = (800, 600), background = None):
+    def __init__(self, resolution = (800, 600), background = None, filesystem = 'filesystem/'):
         self.bg = background
         self.res = resolution
         self.input = Input()
@@ -26,10 +618,20 @@ class VirtualOS:
         self.apps = []
         self.on_run = []
 
+        # clicks go only to the topmost window under the pointer
+        self.windows = WindowIndex(self)
+        self.focused = None
+        # gets the clicks outside of every window and the keys when no window is focused
+        self.desktop = None
+        self.input.on_click.append(self.route_click)
+
         self.time = 0
 
-        self.filesystem = 'filesystem/'
+        # a folder on disk, or any filesystem from vfs.py like a MemoryFS
+        self.fs = DiskFS(filesystem) if isinstance(filesystem, str) else filesystem
+        self.filesystem = self.fs.root or ''
 
+        self.fonts = FontRegistry(self)
         self.font = self.default_font(17)
         
         self.appdir = 'apps/'
@@ -39,55 +641,434 @@ class VirtualOS:
                 self.delete(self.appdir+folder)
 
         self.LOG = ""
+        # the file queue's worker and thread safe apps log too
+        self.log_lock = Lock()
 
         self.copied_text = ""
 
         self.tmpdir = 'tmp/'
 
+        self.assets = AssetCache(self)
+        self.surfaces = SurfacePool()
+        # saves, loads, copies and deletes that don't block the frame
+        self.io = FileQueue(self)
+
+        # screen areas that changed this frame, and what was blitted to the screen in this frame and the last one
+        self.damaged = []
+        self.display_list = []
+        self.old_display_list = []
+
+        # when nothing is animating the loop sleeps until input arrives or an app's requested frame is due
+        self.idle_mode = True
+        self.wake_time = None
+
+        # ms added to self.time every frame instead of the measured frame time, so runs are reproducible
+        self.fixed_dt = None
+
+        # heap of (deadline, order, timer), thread safe apps can schedule from their worker
+        self.timers = []
+        self.timer_order = 0
+        self.timer_lock = Lock()
+
+        # threads updating thread safe apps while the other apps update on the main thread, 0 turns it off
+        self.update_workers = 0
+        self.update_pool = None
+
+        # the asyncio loop app coroutines run on: the running one under start_async, else a private one
+        # that is stepped once a frame
+        self.loop = None
+        self.tasks = set()
+
+        # F3 toggles the performance overlay, F4 exports the recorded frames to tmp/
+        self.profiler = Profiler()
+        self.hud = None
+        self.hud_font = None
+        self.hud_timer = None
+
     def default_font(self, size=17):
-        return pg.font.Font(self.filesystem+'fonts/monospace.otf', size)
+        return self.fonts.get(size=size)
 
     def log(self, text):
         #print(text)
-        self.LOG += text
+        with self.log_lock:
+            self.LOG += text
         
-    def start(self):
+    def boot(self):
         if not self.res:
             self.res = (0,0)
         self.screen = pg.display.set_mode(self.res)
         self.res = self.screen.get_size()
+        self.input.filter_events()
+        self.damage()
         self.run('desktop')
-        while not self.input.quit:
-            self.update()
-            self.render()
-            self.clock.tick(self.fps)
+        self.desktop = self.get_app('desktop')
+
+    def shutdown(self):
+        self.stop_recording()
         for app in reversed(self.apps):
             app.close()
+        self.io.close()
+        if self.update_pool:
+            self.update_pool.shutdown()
+            self.update_pool = None
+        for task in list(self.tasks):
+            task.cancel()
+        if self.loop and not self.loop.is_running():
+            # one more step lets the cancelled tasks finish
+            self.step_tasks()
+            self.loop.close()
+            self.loop = None
         pg.display.quit()
 
+    def start(self):
+        self.boot()
+        while not self.input.quit:
+            self.update()
+            self.render()
+            if self.idle_mode and self.is_idle():
+                wake = self.next_wake()
+                self.input.wait(wake - self.time if wake is not None else 0)
+                self.clock.tick()
+            else:
+                self.clock.tick(self.fps)
+        self.shutdown()
+
+    # the same loop as start, run by an asyncio loop: asyncio.run(vos.start_async()).
+    # app coroutines and awaited I/O run while the OS waits for the next frame
+    async def start_async(self):
+        self.loop = asyncio.get_running_loop()
+        self.boot()
+        while not self.input.quit:
+            started = perf_counter()
+            self.update()
+            self.render()
+            if self.idle_mode and self.is_idle():
+                wake = self.next_wake()
+                await self.wait_async(wake - self.time if wake is not None else 0)
+            else:
+                await asyncio.sleep(max(0, 1 / self.fps - (perf_counter() - started)))
+            self.clock.tick()
+        self.shutdown()
+
+    # SDL can't be awaited, so while idle the queue is checked once a frame. returns early when a task asked for a frame
+    async def wait_async(self, timeout = 0):
+        started = perf_counter()
+        while not pg.event.peek():
+            waited = (perf_counter() - started) * 1000
+            if timeout and waited >= timeout or self.wake_time is not None and self.wake_time <= self.time:
+                return
+            await asyncio.sleep(min(1000 / self.fps, timeout - waited if timeout else 1000) / 1000)
+
+    def get_loop(self):
+        if not self.loop:
+            self.loop = asyncio.new_event_loop()
+        return self.loop
+
+    # runs a coroutine on the loop, exceptions are logged instead of stopping the OS
+    def spawn(self, coro):
+        task = self.get_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+        self.request_frame()
+        return task
+
+    def task_done(self, task):
+        self.tasks.discard(task)
+        self.request_frame()
+        if not task.cancelled() and task.exception():
+            self.log(''.join(traceback.format_exception(task.exception())))
+
+    # lets the private loop run its ready callbacks, the running loop of start_async needs no help
+    def step_tasks(self):
+        if self.loop and not self.loop.is_running():
+            self.loop.call_soon(self.loop.stop)
+            self.loop.run_forever()
+        if self.tasks:
+            # a task waiting on I/O can't wake the OS up, so frames keep coming while any are left
+            self.request_frame(1000 // self.fps)
+
+    # handlers (buttons, menu options, prompts, timers) can be coroutine functions, their coroutines are run as tasks
+    def call(self, fn, *args):
+        result = fn(*args)
+        if asyncio.iscoroutine(result):
+            return self.spawn(result)
+        return result
+
+    # apps that need another frame without any input (e.g. to blink a cursor) ask for one here
+    def request_frame(self, delay = 0):
+        at = self.time + delay
+        with self.timer_lock:
+            if self.wake_time is None or at < self.wake_time:
+                self.wake_time = at
+
+    # calls fn after delay ms, then every period ms if a period is given
+    def schedule(self, delay, fn, period = None):
+        timer = Timer(fn, period)
+        self.push_timer(timer, self.time + delay)
+        return timer
+
+    def every(self, period, fn):
+        return self.schedule(period, fn, period)
+
+    def push_timer(self, timer, deadline):
+        with self.timer_lock:
+            heappush(self.timers, (deadline, self.timer_order, timer))
+            self.timer_order += 1
+
+    def run_timers(self):
+        while self.timers and self.timers[0][0] <= self.time:
+            deadline, _, timer = heappop(self.timers)
+            if timer.cancelled:
+                continue
+            if timer.period:
+                # a late timer skips the calls it missed instead of catching up all at once
+                deadline += timer.period
+                self.push_timer(timer, deadline if deadline > self.time else self.time + timer.period)
+            else:
+                timer.cancelled = True
+            self.call(timer.fn)
+
+    # the earliest time something has to happen without any input
+    def next_wake(self):
+        while self.timers and self.timers[0][2].cancelled:
+            heappop(self.timers)
+        wakes = [wake for wake in (self.wake_time, self.timers[0][0] if self.timers else None) if wake is not None]
+        return min(wakes) if wakes else None
+
+    def is_idle(self):
+        if self.input.quit or self.input.player or pg.event.peek() or any(app.animating and app.can_update for app in self.apps):
+            return False
+        wake = self.next_wake()
+        return wake is None or wake > self.time
+
     def update(self):
-        self.input.update()
-        self.time += self.clock.get_time()
+        self.profiler.start_frame(self.time)
+        started = perf_counter()
+        self.input.update(self.fixed_dt if self.fixed_dt is not None else self.clock.get_time())
+        self.time += self.input.dt
+        if self.wake_time is not None and self.wake_time <= self.time:
+            self.wake_time = None
+        if pg.K_F3 in self.input.keys_inst:
+            self.toggle_hud()
+        if pg.K_F4 in self.input.keys_inst:
+            self.export_profile(self.tmpdir + 'profile')
+        if pg.K_F5 in self.input.keys_inst and not self.input.player:
+            self.toggle_recording()
+        if self.input.exposed:
+            self.damage()
+        self.route_events()
+        self.profiler.measure('[input]', 'update', perf_counter() - started)
+        started = perf_counter()
+        self.io.deliver()
+        self.run_timers()
+        self.step_tasks()
+        self.profiler.measure('[timers]', 'update', perf_counter() - started)
+        pool = self.get_update_pool()
         for app in self.apps:
             if app.can_update:
+                if pool and app.thread_safe:
+                    pool.submit(app)
+                    continue
+                started = perf_counter()
+                app.input.update()
                 app.update()
+                self.profiler.measure(app.name, 'update', perf_counter() - started)
+        if pool:
+            started = perf_counter()
+            for app, seconds in pool.wait():
+                self.profiler.measure(app.name, 'update', seconds)
+            # how long the main thread waited at the barrier
+            self.profiler.measure('[update pool]', 'update', perf_counter() - started)
+
+    # made once a thread safe app runs while update_workers is set
+    def get_update_pool(self):
+        if not self.update_pool and self.update_workers and any(app.thread_safe for app in self.apps):
+            self.update_pool = UpdatePool(self.update_workers)
+        return self.update_pool
+
+    def toggle_hud(self):
+        self.profiler.visible = not self.profiler.visible
+        if self.profiler.visible:
+            if not self.hud_font:
+                self.hud_font = self.default_font(14)
+            self.refresh_hud()
+            self.hud_timer = self.every(250, self.refresh_hud)
+        else:
+            self.hud = None
+            self.hud_timer.cancel()
+
+    def refresh_hud(self):
+        extra = [text_cache.stats(), self.assets.stats(), self.surfaces.stats(), self.fs.stats()]
+        if self.update_pool:
+            extra.append(self.update_pool.stats())
+        self.hud = self.profiler.render_hud(self.hud_font, extra)
+
+    # F5 records the input to tmp/, apps random numbers are seeded so the recording replays the same way
+    def toggle_recording(self):
+        if self.input.recorder:
+            self.stop_recording()
+            return
+        seed = random.getrandbits(32)
+        random.seed(seed)
+        self.input.record(self.tmpdir + f"recording-{int(time.time())}.rec", self.res, seed)
+
+    def stop_recording(self):
+        recorder = self.input.stop_recording()
+        if not recorder:
+            return
+        try:
+            self.fs.write(recorder.path, recorder.data(), binary = True)
+        except OSError:
+            self.log(f"Could not save input recording to {recorder.path}")
+            return
+        self.log(f"Saved input recording to {recorder.path}")
+
+    # plays a recording back instead of SDL input, returns the screen size it was recorded at
+    # path is in vos.fs, like the recordings F5 saves
+    def replay(self, path):
+        res, seed = self.input.replay(self.fs.read(path, True))
+        random.seed(seed)
+        return res
+
+    # writes path.json and path.csv
+    def export_profile(self, path):
+        self.save(path + '.json', self.profiler.to_json())
+        self.save(path + '.csv', self.profiler.to_csv())
+        self.log(f"Exported profile to {path}.json and {path}.csv")
         
     def render(self):
-        if self.bg:
-            self.screen.fill(self.bg)
+        self.display_list = []
+        hidden = self.hidden_apps()
         for app in self.apps:
+            if app in hidden:
+                continue
+            started = perf_counter()
             if app.can_update:
                 app.render()
             elif 'WindowApp' in app.flags:
                 app.dead_render()
-        pg.display.update()
-
-    def save(self, path, data):
-        if isinstance(data, str):
+            self.profiler.measure(app.name, 'render', perf_counter() - started)
+        if self.hud:
+            self.blit(self.hud, (self.res[0] - self.hud.get_width(), 0))
+        started = perf_counter()
+        self.compose()
+        self.profiler.measure('[compose]', 'render', perf_counter() - started)
+        self.profiler.end_frame(self.clock.get_fps())
+
+    # apps completely covered by opaque apps above them in the stack are not rendered
+    def hidden_apps(self):
+        hidden = set()
+        covers = []
+        for app in reversed(self.apps):
+            if not isinstance(app, SurfaceApp) or not app.visible or not app.srf:
+                continue
+            rect = app.screen_rect
+            if not visible_parts(rect, covers):
+                hidden.add(app)
+            elif is_opaque(app.srf):
+                covers.append(rect)
+        return hidden
+
+    # self.apps doubles as the window stack, the last app is drawn on top
+    def raise_app(self, app):
+        if app in self.apps:
+            self.apps.remove(app)
+        self.apps.append(app)
+        self.windows_changed()
+
+    def windows_changed(self):
+        self.windows.dirty = True
+
+    # the topmost visible window at point, including its tab
+    def window_at(self, point):
+        return self.windows.at(point)
+
+    def route_click(self):
+        window = self.window_at(self.input.mouse)
+        if window:
+            window.on_click()
+
+    # keyboard events go to the focused window, mouse events to the window under the pointer or else the desktop.
+    # apps that aren't updating get nothing
+    def route_events(self):
+        for event in self.input.events:
+            if isinstance(event, KEYBOARD_EVENTS):
+                app = self.focused or self.desktop
+            elif isinstance(event, MouseMotion):
+                app = self.window_at(event.pos) or self.desktop
+                if app and not app.raw_motion:
+                    continue
+            else:
+                app = self.window_at(getattr(event, 'pos', self.input.mouse)) or self.desktop
+            if app and app.can_update:
+                app.input.push(event)
+
+    # motion events are only fetched while a running app asks for them
+    def filter_events(self):
+        self.input.set_raw_motion(any(app.raw_motion for app in self.apps))
+
+    def damage(self, rect = None):
+        self.damaged.append(pg.Rect(rect) if rect else pg.Rect((0, 0), self.res))
+
+    # apps blit through here so only the damaged parts of the screen get redrawn
+    def blit(self, srf, pos):
+        self.display_list.append((srf, (*pos, *srf.get_size())))
+
+    def moved_areas(self):
+        old, new = self.old_display_list, self.display_list
+        if old == new:
+            return []
+        old_set, new_set = set(old), set(new)
+        # surfaces that appeared, disappeared, moved or were resized
+        areas = [rect for srf, rect in old_set ^ new_set]
+        # surfaces that switched places in the stacking order
+        old_kept = [entry for entry in old if entry in new_set]
+        kept = [entry for entry in new if entry in old_set]
+        if old_kept != kept:
+            old_order = {entry: i for i, entry in enumerate(old_kept)}
+            for i, entry in enumerate(kept):
+                for other in kept[i+1:]:
+                    if old_order[entry] > old_order[other]:
+                        overlap = pg.Rect(entry[1]).clip(other[1])
+                        if overlap:
+                            areas.append(overlap)
+        return areas
+
+    def compose(self):
+        rects = merge_rects(self.damaged + self.moved_areas(), self.screen.get_rect())
+        self.damaged = []
+        if rects:
+            # only the parts of each surface that are not covered by opaque surfaces above it get blitted
+            layers = []
+            covers = []
+            for srf, dest in reversed(self.display_list):
+                parts = visible_parts(dest, covers)
+                if parts:
+                    layers.append((srf, dest, parts))
+                if is_opaque(srf):
+                    covers.append(dest)
+            layers.reverse()
+            for rect in rects:
+                if self.bg:
+                    for part in visible_parts(rect, covers):
+                        self.screen.fill(self.bg, part)
+                for srf, (x, y, w, h), parts in layers:
+                    for part in parts:
+                        area = part.clip(rect)
+                        if area:
+                            self.screen.blit(srf, area, area.move(-x, -y))
+        self.old_display_list = self.display_list
+        if rects:
+            pg.display.update(rects)
+
+    # data is a string or an iterable of strings that are written one after the other.
+    # with fsync the data is on the disk once this returns
+    def save(self, path, data, fsync = False):
+        if data is None:
             self.log(f"Invalid save data.")
+            return False
         try:
-            with open(self.filesystem + path, 'w') as f:
-                f.write(data)
+            self.fs.write(path, data, fsync = fsync)
         except FileNotFoundError:
             self.log(f"Could not find parent folder for: {path}")
             return False
@@ -98,27 +1079,47 @@ class VirtualOS:
             
     def load(self, path):
         try:
-            return open(self.filesystem + path).read()
+            return self.fs.read(path)
         except FileNotFoundError:
             self.log(f"File not found: {path}")
             return None
 
+    # awaitable save and load for app coroutines, done by the file queue
+    async def save_async(self, path, data):
+        future = asyncio.get_running_loop().create_future()
+        self.io.save(path, data, lambda result: future.done() or future.set_result(result))
+        return await future
+
+    async def load_async(self, path):
+        future = asyncio.get_running_loop().create_future()
+        self.io.load(path, lambda result: future.done() or future.set_result(result))
+        return await future
+
+    # waits for queued file operations on either path first, vos.io.rename doesn't block
     def rename(self, from_path, to_path):
+        self.io.settle(from_path, to_path)
         try:
-            rename(self.filesystem + from_path, self.filesystem + to_path)
+            self.fs.rename(from_path, to_path)
             return True
         except FileNotFoundError:
             self.log(f"Invalid path: {from_path} or {to_path}")
         return False
 
-    # from_path is a file, while to_path is a folder
-    def copy(self, from_path, to_path):
-        return self.save(to_path + '/' + from_path.split('/')[-1], self.load(from_path))
+    # from_path is a file, while to_path is a folder. the bytes are copied, so it works for images too
+    def copy(self, from_path, to_path, fsync = False):
+        try:
+            self.fs.write(to_path + '/' + from_path.split('/')[-1], self.fs.read(from_path, True), True, fsync)
+            return True
+        except FileNotFoundError:
+            self.log(f"Invalid path: {from_path} or {to_path}")
+        except IsADirectoryError:
+            self.log(f"Could not copy {from_path} as a folder already has the same name in {to_path}")
+        return False
 
 
     def make_folder(self, path):
         try:
-            mkdir(self.filesystem + path)
+            self.fs.mkdir(path)
             return True
         except FileExistsError:
             self.log(f"Tried to create folder that already exists: {path}")
@@ -128,34 +1129,31 @@ class VirtualOS:
             return False
 
     def delete(self, path):
-        path = self.filesystem + path
-        
-        if not exists(path):
+        if not self.exists(path):
             return False
+        self.fs.remove(path)
+        return True
 
-        if isdir(path):
-            rmdir(path)
-        else:
-            remove(path)
-        return True    
-        
+    def isdir(self, path):
+        return self.fs.isdir(path)
+
+    def exists(self, path):
+        return self.fs.exists(path)
 
     def list_folder(self, path):
         try:
-            return listdir(self.filesystem + path)
+            return self.fs.listdir(path)
         except FileNotFoundError:
             self.log(f"Did not find file: {path}")
             return None
 
     # folder paths must not end in a "/"!
     def copy_folder(self, from_path, to_path):
-        from_path = self.filesystem + from_path
-        to_path = self.filesystem + to_path
-        if isdir(from_path) and isdir(to_path):
+        if self.isdir(from_path) and self.isdir(to_path):
             copied_path = to_path + '/' + from_path.split('/')[-1]
             self.make_folder(copied_path)
             for file in self.list_folder(from_path):
-                if isdir(file):
+                if self.isdir(from_path+'/'+file):
                     self.copy_folder(from_path+'/'+file, copied_path)
                 else:
                     self.copy(from_path+'/'+file, copied_path)
@@ -164,13 +1162,11 @@ class VirtualOS:
             return False
         return True
 
-    def load_image(self, path, transparent = False):
-        path = self.filesystem + path
-        if not exists(path):
-            self.log(f"Image not found: {path}")
-            return
-        srf = pg.image.load(path)
-        srf = srf.convert_alpha() if transparent else srf.convert()
+    # size gives a cached scaled copy, smooth uses smoothscale for it
+    def load_image(self, path, transparent = False, size = None, smooth = False):
+        srf = self.assets.image(path, transparent, size, smooth)
+        if not srf:
+            self.log(f"Image not found: {self.filesystem + path}")
         return srf
 
     def install(self, appfolder):
@@ -194,18 +1190,25 @@ class VirtualOS:
             if "WindowApp" in app.flags:
                 app.can_update = False
 
-    def run(self, name):
+    # isolated window apps run in their own process, see process_app.py
+    # the first app that can open path opens it
+    def open_path(self, path):
+        return any(app.open_path(path) for app in list(self.apps))
+
+    def run(self, name, isolated = False):
         if name in self.app_names:
             self.log(f"{name} is currently running.")
             return 2
-        path = self.filesystem + self.appdir + f'{name}/app.py'
-        if exists(path):
-            App = import_app(path, name)
-            app = App(name, self)
+        path = self.appdir + f'{name}/app.py'
+        if self.exists(path):
+            if isolated:
+                # process_app imports this module
+                from process_app import ProcessApp
+                app = ProcessApp(name, self, path)
+            else:
+                App = import_app(self.filesystem + path, name, self.load(path))
+                app = App(name, self)
             app.run()
-            # on_run functions use the app run as a parameter
-            for fun in self.on_run:
-                fun(app)
             return 1
         self.log(f"Could not find app {name} to run.")
         return 0
@@ -220,6 +1223,18 @@ class App:
         self.vos.make_folder(self.path) # ensure app folder exists
         self.flags = []
         self.supported_types = []
+        # animating apps keep the OS running at full frame rate while they update
+        self.animating = False
+        # timers and tasks are cancelled when the app closes
+        self.timers = []
+        self.tasks = []
+        # only the events routed to this app
+        self.input = AppInput(self.vos.input)
+        # apps that draw with the mouse can ask for every motion event instead of one position per frame
+        self.raw_motion = False
+        # apps whose update only changes their own state (and schedules timers or requests frames) can be
+        # updated on a worker thread, see VirtualOS.update_workers. rendering always stays on the main thread
+        self.thread_safe = False
 
     def can_open_path(self, path):
         return path.split('.')[-1] in self.supported_types
@@ -236,7 +1251,27 @@ class App:
     def delete(self, path):return self.vos.delete(self.path + path)
     def list_folder(self, path):return self.vos.list_folder(self.path + path)
     def copy_folder(self, from_path, to_path):return self.vos.list_folder(self.path + from_path, self.path + to_path)
-    def load_image(self, path):return self.vos.load_image(self.path + path)
+    def load_image(self, path, transparent = False, size = None, smooth = False):return self.vos.load_image(self.path + path, transparent, size, smooth)
+
+    def schedule(self, delay, fn, period = None):
+        self.timers = [timer for timer in self.timers if not timer.cancelled]
+        timer = self.vos.schedule(delay, fn, period)
+        self.timers.append(timer)
+        return timer
+    def every(self, period, fn):return self.schedule(period, fn, period)
+
+    def spawn(self, coro):
+        self.tasks = [task for task in self.tasks if not task.done()]
+        task = self.vos.spawn(coro)
+        self.tasks.append(task)
+        return task
+
+    # like vos.call, but a coroutine becomes a task of this app
+    def call(self, fn, *args):
+        result = fn(*args)
+        if asyncio.iscoroutine(result):
+            return self.spawn(result)
+        return result
     
     def uninstall(self):
         self.vos.log(f'uninstalling {self.name}')
@@ -245,14 +1280,28 @@ class App:
     def run(self):
         self.vos.log(f'running {self.name}')
         self.vos.apps.append(self)
+        self.vos.windows_changed()
+        self.vos.filter_events()
+        self.vos.request_frame()
         self.on_run()
+        # on_run functions use the app run as a parameter
+        for fun in self.vos.on_run:
+            fun(self)
         
     def close(self):
         self.vos.log(f'closing {self.name}')
         if self.on_close:
             self.on_close()
+        for timer in self.timers:
+            timer.cancel()
+        for task in self.tasks:
+            task.cancel()
         if "app.py" not in self.list_folder(""):self.delete("")
         if self in self.vos.apps:self.vos.apps.remove(self)
+        if self.vos.focused is self:self.vos.focused = None
+        self.vos.windows_changed()
+        self.vos.filter_events()
+        self.vos.surfaces.release_owner(self)
         
     def update(self):
         pass
@@ -267,11 +1316,18 @@ class SurfaceApp(App):
         self.pos = pos
         self.srf = None
         self.visible = True
+        # apps that call damage() whenever their surface changes are only redrawn where they changed
+        self.reports_damage = False
 
     @property
     def rect(self):
         return list(self.pos)+list(self.res)
 
+    # the area the app covers on the screen
+    @property
+    def screen_rect(self):
+        return self.rect
+
     def center(self):
         w, h = self.res
         W, H = self.vos.res
@@ -280,12 +1336,20 @@ class SurfaceApp(App):
     def run(self):
         if not self.res: self.res = self.vos.res
         if not self.pos: self.center()
-        if not self.srf: self.srf = pg.Surface(self.res)
+        if not self.srf: self.srf = self.vos.surfaces.get(self.res, owner=self)
         super().run()
+        self.damage()
+
+    # rect is relative to the app surface, defaults to all of it
+    def damage(self, rect = None):
+        x, y, w, h = rect if rect else (0, 0, *self.res)
+        self.vos.damage((self.pos[0] + x, self.pos[1] + y, w, h))
         
     def render(self):
         if self.visible:
-            self.vos.screen.blit(self.srf, self.pos)
+            self.vos.blit(self.srf, self.pos)
+            if not self.reports_damage:
+                self.damage()
 
 
 class WindowApp(SurfaceApp):
@@ -302,54 +1366,78 @@ class WindowApp(SurfaceApp):
         self.tab_minimize = (255, 200, 0)
 
         self.can_minimize = True
+        self.tab_srf = None
 
         self.dragging = False
         self.drag_from = (0, 0)
 
         self.bg = (50,50,50)
 
+    # the window index has to know when a window moves, resizes, shows or hides
+    @property
+    def pos(self):
+        return self._pos
+    @pos.setter
+    def pos(self, pos):
+        self._pos = pos
+        self.vos.windows_changed()
+
+    @property
+    def res(self):
+        return self._res
+    @res.setter
+    def res(self, res):
+        self._res = res
+        self.vos.windows_changed()
+
+    @property
+    def visible(self):
+        return self._visible
+    @visible.setter
+    def visible(self, visible):
+        self._visible = visible
+        self.vos.windows_changed()
+
     def resize(self, resolution = None):
         if resolution:
             self.res = resolution
         else:
             self.res = self.vos.res
         self.center()
-        self.srf = pg.Surface(self.res)
+        self.vos.surfaces.release(self.srf)
+        self.srf = self.vos.surfaces.get(self.res, owner=self)
 
     def make_tab_srf(self):
         w, h = (self.res[0], self.tab_height)
-        self.tab_srf = pg.Surface((w,h))
+        if self.tab_srf:
+            self.vos.surfaces.release(self.tab_srf)
+        self.tab_srf = self.vos.surfaces.get((w,h), owner=self)
         self.tab_srf.fill(self.tab_bg)
         pg.draw.rect(self.tab_srf, self.tab_close, (w-h, 0, h, h))
         if self.can_minimize:
             pg.draw.rect(self.tab_srf, self.tab_minimize, (w-h*2, 0, h, h))
 
     def focus(self):
-        self.vos.stop_all_window_apps()
+        focused = self.vos.focused
+        if focused and focused is not self:
+            focused.can_update = False
+            focused.input.reset()
+        self.vos.focused = self
         self.can_update = True
-        if self in self.vos.apps:self.vos.apps.remove(self)
-        self.vos.apps.append(self)
+        self.vos.raise_app(self)
 
     def on_run(self):
         self.srf.fill(self.bg)
         self.make_tab_srf()
-        self.vos.input.on_click.append(self.on_click)
         self.focus()
 
-    def on_close(self):
-        on_clicks = self.vos.input.on_click
-        if self.on_click in on_clicks:
-            on_clicks.remove(self.on_click)
-
+    # only called for the topmost window under the pointer
     def on_click(self):
         tabx, taby = self.tab_pos
         tabh = self.tab_height
         mx, my = self.vos.input.mouse
 
-        w,h = self.res
-
-        if point_within_rect((mx, my), (tabx, taby, w, h+tabh)):
-            self.focus()
+        self.focus()
         
         if point_within_rect((mx, my), (tabx, taby, self.res[0], tabh)):
             if mx > tabx + self.res[0] - tabh: # close button
@@ -381,11 +1469,17 @@ class WindowApp(SurfaceApp):
     @property
     def full_rect(self):
         return list(self.tab_pos) + [self.res[0], self.res[1]+self.tab_height]
+
+    @property
+    def screen_rect(self):
+        return self.full_rect if self.res != self.vos.res else self.rect
     
     def update(self):
         if not self.visible:
             return
         if self.dragging:
+            # motion events are filtered out, so the idle loop is kept awake for the whole drag
+            self.vos.request_frame()
             mx, my = self.vos.input.mouse
             dx, dy = self.drag_from
             self.pos = (mx - dx, my - dy)
@@ -394,70 +1488,220 @@ class WindowApp(SurfaceApp):
     
     def render(self):
         if self.visible:
-            self.vos.screen.blit(self.srf, self.pos)
-            if self.res != self.vos.res:
-                self.vos.screen.blit(self.tab_srf, self.tab_pos)
+            self.dead_render()
+            if not self.reports_damage:
+                self.damage()
     
     def dead_render(self):
         if self.visible:
-            self.vos.screen.blit(self.srf, self.pos)
+            self.vos.blit(self.srf, self.pos)
             if self.res != self.vos.res:
-                self.vos.screen.blit(self.tab_srf, self.tab_pos)
+                self.vos.blit(self.tab_srf, self.tab_pos)
 
 class NodeApp(WindowApp):
     def __init__(self, name, vos, resolution=None):
         super().__init__(name, vos, resolution)
+        # areas of the app surface to clear and draw again, the surface last drawn to
+        self.dirty_rects = []
+        self.dirty = True
+        self.drawn_srf = None
         self.children = []
         self.global_pos = (0,0)
+        self.reports_damage = True
+    def run(self):
+        if not self.res: self.res = self.vos.res
+        self.layout()
+        super().run()
+    def resize(self, resolution = None):
+        super().resize(resolution)
+        self.invalidate()
+        self.layout()
+    # children with fill set always cover the whole app
+    def layout(self):
+        for node in self.children:
+            if node.fill and self.res:
+                node.x, node.y = 0, 0
+                node.resize(self.res)
+    # replacing the children redraws the whole app
+    @property
+    def children(self):
+        return self._children
+    @children.setter
+    def children(self, children):
+        self._children = children
+        self.invalidate()
+    # rect is relative to the app surface, None redraws all of it
+    def invalidate(self, rect = None):
+        if rect:
+            self.dirty_rects.append(pg.Rect(rect))
+        else:
+            self.drawn_srf = None
+        self.dirty = True
     def update(self):
         super().update()
         for node in self.children:
             node.update()
-    def render(self):
-        self.srf.fill(self.bg)
+    def sync(self):
         for node in self.children:
-            node.render()
+            node.sync()
+    # only the dirty areas are cleared and drawn again, by every node overlapping them
+    def render(self):
+        if self.visible:
+            self.sync()
+            if self.srf is not self.drawn_srf:
+                self.drawn_srf = self.srf
+                self.dirty_rects = [self.srf.get_rect()]
+                self.dirty = True
+            if self.dirty:
+                for rect in merge_rects(self.dirty_rects, self.srf.get_rect()):
+                    self.srf.set_clip(rect)
+                    self.srf.fill(self.bg)
+                    for node in self.children:
+                        node.draw(rect)
+                    self.damage(rect)
+                self.srf.set_clip(None)
+                for node in self.children:
+                    node.clean()
+                self.dirty_rects = []
+                self.dirty = False
         super().render()
     def add(self, node):
         self.children.append(node)
         node.parent = self
         node.orphan = False
+        node.moved()
+        if node.fill:
+            self.layout()
     def remove(self, node):
         self.children.remove(node)
+        node.erase()
         node.orphan = True
 
 class Node:
+    # attributes that don't change how the node looks, names starting with _ or drawn are skipped too
+    UNTRACKED = {'app', 'vos', 'children', 'orphan', 'dirty', 'old_text', 'pressed'}
+    parent = None
+    orphan = True
+    # share of the free space the node gets in a RowNode or ColumnNode, 0 keeps its own size
+    flex = 1
+    # a child of a NodeApp that always covers the whole app
+    fill = False
+    dirty = False
+    # where the node was last drawn on the app surface
+    drawn_rect = None
+    _global_pos = None
     def __init__(self, app, pos=(0,0)):
         self.app = app
         self.vos = app.vos
         self.children = []
-        self.parent = None
         self.x, self.y = pos
-        self.orphan = True
+    # setting an attribute to a new value redraws the node, moving it moves its children too
+    def __setattr__(self, name, value):
+        if name in self.UNTRACKED or name.startswith(('_', 'drawn')):
+            object.__setattr__(self, name, value)
+            return
+        if isinstance(getattr(type(self), name, None), property):
+            # a property's value isn't in __dict__
+            try:
+                old = getattr(self, name)
+            except AttributeError:
+                old = Node
+        else:
+            old = self.__dict__.get(name, Node)
+        object.__setattr__(self, name, value)
+        if old is value or old == value:
+            return
+        if name in ('x', 'y', 'parent'):
+            self.moved()
+        else:
+            self.changed()
+    # position on the app surface, cached until the node or one of its parents moves
     @property
     def global_pos(self):
-        x, y = self.parent.global_pos
-        return self.x, self.y
+        if self._global_pos is None:
+            px, py = self.parent.global_pos if self.parent else (0, 0)
+            self._global_pos = (px + self.x, py + self.y)
+        return self._global_pos
+    # the area the node draws to on the app surface
+    @property
+    def bounds(self):
+        size = self.__dict__.get('size')
+        return (*self.global_pos, *size) if size else None
+    # rect defaults to the node's bounds, the node and its parents are marked dirty
+    def invalidate(self, rect = None):
+        if self.orphan:
+            return
+        rect = rect if rect else self.bounds
+        if rect:
+            self.app.invalidate(rect)
+        node = self
+        while node and not node.dirty:
+            node.dirty = True
+            node = getattr(node, 'parent', None)
+    def changed(self):
+        if self.drawn_rect:
+            self.invalidate(self.drawn_rect)
+        self.invalidate()
+    def moved(self):
+        self._global_pos = None
+        self.changed()
+        for node in self.children:
+            node.moved()
+    def erase(self):
+        if self.drawn_rect:
+            self.invalidate(self.drawn_rect)
+            self.drawn_rect = None
+        for node in self.children:
+            node.erase()
+    # checks state the node doesn't own (e.g. a buffer edited by its app) before rendering
+    def sync(self):
+        for node in self.children:
+            node.sync()
+    # renders the node if it overlaps rect, then its children
+    def draw(self, rect):
+        bounds = self.bounds
+        if not bounds or rect.colliderect(bounds):
+            self.render()
+        for node in self.children:
+            node.draw(rect)
+    def clean(self):
+        self.dirty = False
+        self.drawn_rect = self.bounds
+        for node in self.children:
+            node.clean()
+    def resize(self, size):
+        self.size = tuple(size)
     def update(self):
         for node in self.children:
             node.update()
     def render(self):
-        for node in self.children:
-            node.render()
+        pass
     def add(self, node):
         self.children.append(node)
         node.parent = self
         node.orphan = False
+        node.moved()
     def remove(self, node):
         self.children.remove(node)
+        node.erase()
         node.orphan = True
 
 class SurfaceNode(Node):
     def __init__(self, app, pos=(0,0), size=(100, 100), draw_srf = None):
         super().__init__(app, pos)
         self.size = size
-        self.srf = pg.Surface(size)
+        self.srf = self.vos.surfaces.get(size, owner=app)
         self.draw_srf = draw_srf
+    # a new surface is only made when the size actually changes
+    def resize(self, size):
+        size = tuple(size)
+        if size != tuple(self.size):
+            self.size = size
+            self.vos.surfaces.release(self.srf)
+            self.srf = self.vos.surfaces.get(size, owner=self.app)
+            self.resized()
+    def resized(self):
+        pass
     def render(self):
         srf = self.draw_srf if self.draw_srf else self.app.srf
         srf.blit(self.srf, self.global_pos)
@@ -467,7 +1711,6 @@ class RectNode(Node):
     def __init__(self, app, pos=(0,0), size=(100, 100), color=(255,0,255)):
         super().__init__(app, pos)
         self.size = size
-        self.srf = pg.Surface(size)
         self.color = color
     def render(self):
         pg.draw.rect(self.app.srf, self.color, list(self.global_pos) + list(self.size))
@@ -482,12 +1725,14 @@ class TextNode(SurfaceNode):
         self.color = color
         self.bg = background
         self.center = center
+    def resized(self):
+        self.old_text = None
     def render(self):
         if self.text != self.old_text:
             if self.bg:
                 self.srf.fill(self.bg)
             self.old_text = self.text
-            srf = self.font.render(self.text, True, self.color, self.bg)
+            srf = render_text(self.font, self.text, True, self.color, self.bg)
             if not self.center:
                 self.srf.blit(srf, (0,0))
             else:
@@ -496,49 +1741,119 @@ class TextNode(SurfaceNode):
                 self.srf.blit(srf, (W//2-w//2,H//2-h//2))
         super().render()
 
+# only the lines inside the view are rasterized, and only when they changed or the view scrolled
 class ScrollTextNode(SurfaceNode):
+    # sync() finds the rows that changed
+    UNTRACKED = Node.UNTRACKED | {'text', 'lines'}
     def __init__(self, app, pos=(0,0), size=(100, 100), text="This is a TextNode", font = None, color=(255,255,255), background=(0,0,0), center = False, line_height = None, draw_srf = None):
         super().__init__(app, pos, size, draw_srf)
-        self.text = text
+        # lines can be any sequence of strings, setting text splits it into a list
+        self.lines = []
         self.old_text = None
+        self.text = text
         self.font = font if font else self.vos.font
         self.color = color
         self.bg = background
         self.center = center
-        self.line_height = line_height if line_height else self.font.render("lyg", True, [0]*3).get_height()
+        self.line_height = line_height if line_height else self.vos.fonts.measure(self.font).line_height
         self.scroll = 0
-        self.old_scroll = None
-        self.nlines = 0
         self.speed = 1
+        # line text drawn in each visible row of self.srf
+        self.drawn_rows = {}
+        self.drawn_scroll = None
+    @property
+    def text(self):
+        return '\n'.join(self.lines)
+    @text.setter
+    def text(self, text):
+        if text != self.old_text:
+            self.old_text = text
+            self.lines = text.split('\n')
+    def resized(self):
+        self.drawn_scroll = None
+        self.drawn_rows = {}
+    @property
+    def nlines(self):
+        return len(self.lines)
     def update(self):
         if not self.app.visible:
             return
-        self.scroll -= self.vos.input.scroll * self.speed * self.line_height
+        self.scroll -= self.app.input.scroll * self.speed * self.line_height
         self.scroll = max(min(self.scroll, (self.line_height * self.nlines - self.size[1])), 0)
         super().update()
+    def visible_rows(self):
+        first = self.scroll // self.line_height
+        last = min(self.nlines, -(-(self.scroll + self.size[1]) // self.line_height))
+        return range(max(first, 0), last)
+    def row_rect(self, row):
+        x, y = self.global_pos
+        rect = pg.Rect(x, y + row * self.line_height - self.scroll, self.size[0], self.line_height)
+        return rect.clip(self.bounds)
+    # the lines can be edited without setting any attribute, so the rows that changed are found here
+    def sync(self):
+        if self.scroll == self.drawn_scroll:
+            rows = self.visible_rows()
+            for row in self.drawn_rows.keys() - set(rows):
+                self.invalidate(self.row_rect(row))
+            for row in rows:
+                if self.drawn_rows.get(row) != self.lines[row]:
+                    self.invalidate(self.row_rect(row))
+        super().sync()
+    def draw_row(self, row, line):
+        y = row * self.line_height - self.scroll
+        self.srf.fill(self.bg or (0,0,0), (0, y, self.size[0], self.line_height))
+        if line:
+            srf = render_text(self.font, line, True, self.color, self.bg)
+            if not self.center:
+                self.srf.blit(srf, (0, y))
+            else:
+                w, h = srf.get_size()
+                self.srf.blit(srf, (self.size[0]//2-w//2, y+self.line_height//2-h//2))
     def render(self):
-        if self.text != self.old_text:
-            lines = self.text.split('\n')
-            self.nlines = len(lines)
-            self.text_srf = pg.Surface((self.size[0], self.line_height * self.nlines))
-            if self.bg:
-                self.text_srf.fill(self.bg)
-            y = 0
-            for line in lines:
-                text = TextNode(self.app, (0,y), (self.size[0], self.line_height),
-                                line, self.font, self.color, self.bg, self.center,
-                                draw_srf = self.text_srf)
-                text.parent = self
-                text.render()
-                y += self.line_height
-
-        if self.scroll != self.old_scroll or self.text != self.old_text:
-            self.old_text = self.text
-            self.old_scroll = self.scroll
-            self.srf.fill(self.bg)
-            self.srf.blit(self.text_srf, (0, -self.scroll))
+        rows = {row: self.lines[row] for row in self.visible_rows()}
+        if self.scroll != self.drawn_scroll:
+            self.drawn_scroll = self.scroll
+            self.srf.fill(self.bg or (0,0,0))
+            for row, line in rows.items():
+                self.draw_row(row, line)
+        else:
+            for row in self.drawn_rows.keys() - rows.keys():
+                self.draw_row(row, "")
+            for row, line in rows.items():
+                if self.drawn_rows.get(row) != line:
+                    self.draw_row(row, line)
+        self.drawn_rows = rows
         super().render()
 
+# a block cursor drawn over a ScrollTextNode, so moving or blinking it only redraws its own rect
+class CaretNode(RectNode):
+    def __init__(self, app, view, color=(255,255,255)):
+        super().__init__(app, size=(0,0), color=color)
+        self.view = view
+        self.row = 0
+        self.col = 0
+        self.visible = True
+        self.area = None
+    @property
+    def bounds(self):
+        return self.area
+    def caret_rect(self):
+        view = self.view
+        line = view.lines[self.row] if self.row < view.nlines else ""
+        metrics = self.vos.fonts.measure(view.font)
+        x = metrics.width(line[:self.col])
+        w = metrics.width(line[self.col:self.col+1] or " ")
+        vx, vy = view.global_pos
+        rect = pg.Rect(vx + x, vy + self.row * view.line_height - view.scroll, w, view.line_height)
+        return rect.clip(view.bounds)
+    # the caret moves with the text under it
+    def sync(self):
+        rect = self.caret_rect() if self.visible else None
+        self.area = tuple(rect) if rect else None
+    def render(self):
+        if self.area:
+            pg.draw.rect(self.app.srf, self.color, self.area)
+
 class ButtonNode(TextNode):
     def __init__(self, app, pos=(0,0), size=(100, 100), text="This is a TextNode",
                  font = None, color=(255,255,255), background=(0,0,0), on_press=None,
@@ -550,13 +1865,102 @@ class ButtonNode(TextNode):
         super().update()
         if not self.app.visible:
             return
-        inp = self.vos.input
+        inp = self.app.input
         self.pressed = True
-        if inp.click_inst and point_within_rect(self.app.mouse, [self.x, self.y]+list(self.size)) and self.on_press:
-            self.on_press()
+        if inp.click_inst and point_within_rect(self.app.mouse, self.bounds) and self.on_press:
+            self.app.call(self.on_press)
             self.pressed = True
         
 
+# containers that size and place their children inside padding, with spacing between them.
+# the layout is only computed again when the size or the children changed
+class LayoutNode(Node):
+    def __init__(self, app, pos=(0,0), size=(100, 100), padding=0, spacing=0, color=None, fill=False):
+        super().__init__(app, pos)
+        self.size = tuple(size)
+        self.padding = padding
+        self.spacing = spacing
+        self.color = color
+        self.fill = fill
+        self._layout_key = None
+    def layout_key(self):
+        return (self.size, self.padding, self.spacing, tuple(map(id, self.children)))
+    def layout(self):
+        key = self.layout_key()
+        if key == self._layout_key:
+            return
+        self._layout_key = key
+        p = self.padding
+        w, h = self.size[0] - p*2, self.size[1] - p*2
+        for node, (x, y, cw, ch) in zip(self.children, self.cells(max(w, 0), max(h, 0))):
+            node.x, node.y = p + x, p + y
+            node.resize((cw, ch))
+    # (x, y, w, h) of every child inside the padding
+    def cells(self, w, h):
+        return []
+    def resize(self, size):
+        self.size = tuple(size)
+        self.layout()
+    def add(self, node):
+        super().add(node)
+        self.layout()
+    def remove(self, node):
+        super().remove(node)
+        self.layout()
+    def render(self):
+        if self.color:
+            pg.draw.rect(self.app.srf, self.color, self.bounds)
+
+# children side by side, the free space is shared by their flex weights
+class RowNode(LayoutNode):
+    axis = 0
+    def layout_key(self):
+        return super().layout_key() + tuple(node.flex or node.size[self.axis] for node in self.children)
+    def lengths(self, length):
+        nodes = self.children
+        fixed = sum(node.size[self.axis] for node in nodes if not node.flex)
+        free = max(0, length - fixed - self.spacing * (len(nodes) - 1))
+        total = sum(node.flex for node in nodes)
+        lengths, used, weight = [], 0, 0
+        for node in nodes:
+            if not node.flex:
+                lengths.append(node.size[self.axis])
+                continue
+            weight += node.flex
+            end = free * weight // total
+            lengths.append(end - used)
+            used = end
+        return lengths
+    def cells(self, w, h):
+        at = 0
+        cells = []
+        for length in self.lengths((w, h)[self.axis]):
+            cells.append((at, 0, length, h) if self.axis == 0 else (0, at, w, length))
+            at += length + self.spacing
+        return cells
+
+# children stacked from top to bottom
+class ColumnNode(RowNode):
+    axis = 1
+
+# children in equal cells, filled row by row
+class GridNode(LayoutNode):
+    def __init__(self, app, pos=(0,0), size=(100, 100), columns=2, padding=0, spacing=0, color=None, fill=False):
+        super().__init__(app, pos, size, padding, spacing, color, fill)
+        self.columns = columns
+    def layout_key(self):
+        return super().layout_key() + (self.columns,)
+    def cells(self, w, h):
+        s = self.spacing
+        cols = self.columns
+        rows = max(1, -(-len(self.children) // cols))
+        cells = []
+        for i in range(len(self.children)):
+            row, col = divmod(i, cols)
+            x, y = (w + s) * col // cols, (h + s) * row // rows
+            cells.append((x, y, (w + s) * (col + 1) // cols - s - x, (h + s) * (row + 1) // rows - s - y))
+        return cells
+
 class TextApp(WindowApp):
     def __init__(self, name, vos, resolution=None, font=None):
         super().__init__(name, vos, resolution)
@@ -569,6 +1973,7 @@ class TextApp(WindowApp):
         self.bg = (0,0,0)
         self.color = (255,255,255)
         self.old_text = ""
+        self.reports_damage = True
     def update_render(self, text):
         if text == self.old_text:
             return
@@ -580,8 +1985,9 @@ class TextApp(WindowApp):
         for line in lines:
             if line:
                 self.srf.blit(
-                    self.font.render(line, True, self.color, self.bg), (x,y))
+                    render_text(self.font, line, True, self.color, self.bg), (x,y))
             y += self.line_height
+        self.damage()
 
 class DictMenuApp(TextApp):
     def __init__(self, name, vos, resolution=None):
@@ -628,14 +2034,14 @@ class DictMenuApp(TextApp):
         for i in range(len(options)):
             s += ('> ' if self.idx == i else '  ') + options[i] + '\n'
 
-        if pg.K_RETURN in self.vos.input.keys_inst:
+        if pg.K_RETURN in self.input.keys_inst:
             choice = options[self.idx]
             self.idx = 0
             if choice == self.BACK:
                 self.back()
             elif isinstance(branch[choice], dict):
                 self.location.append(choice)
-            elif branch[choice]:branch[choice]()
+            elif branch[choice]:self.call(branch[choice])
 
         self.update_render(s)
 
@@ -647,7 +2053,7 @@ class DictMenuApp(TextApp):
         if not self.visible:
             return
         super().update()
-        inp = self.vos.input
+        inp = self.input
         if pg.K_UP in inp.keys_inst:
             self.idx -= 1
         if pg.K_DOWN in inp.keys_inst:
@@ -659,18 +2065,17 @@ class PromptApp(TextApp):
     def __init__(self, name, vos, prompt="Enter text:", callback=None, resolution=(400, 75)):
         super().__init__(name, vos, resolution)
         self.can_minimize = False
-        self.vos.input.text = ""
         self.prompt, self.callback = prompt, callback
-        self.vos.input.keys_inst = []
         self.bg = (255,255,255)
         self.color = (0,0,0)
     def update(self):
-        inp = self.vos.input
+        inp = self.input
         if not self.visible:
             return
         super().update()
         if pg.K_RETURN in inp.keys_inst:
-            self.callback(inp.text)
+            # the prompt closes right away, so a coroutine callback isn't cancelled with it
+            self.vos.call(self.callback, inp.text)
             self.close()
         self.update_render(self.prompt+'\n'+inp.text)
         